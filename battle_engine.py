@@ -0,0 +1,106 @@
+import random
+
+CHALLENGER = 0
+OPPONENT = 1
+
+
+class AttackResult:
+    """Outcome of one attack; Battle turns this into an embed, the simulator just counts it."""
+
+    __slots__ = ("side", "move_name", "move_info", "damage", "type_effectiveness",
+                 "is_critical", "messages", "fainted")
+
+    def __init__(self, side, move_name, move_info, damage=0, type_effectiveness=1.0,
+                 is_critical=False, messages=(), fainted=False):
+        self.side = side
+        self.move_name = move_name
+        self.move_info = move_info  # None if the move doesn't exist
+        self.damage = damage
+        self.type_effectiveness = type_effectiveness
+        self.is_critical = is_critical
+        self.messages = messages
+        self.fainted = fainted
+
+
+class BattleState:
+    """
+    Pure battle state for two Pokémon: no Discord objects, no I/O, no sleeps.
+    `damage_fn(attacker, defender, move_name)` returns (damage, effectiveness, crit, messages)
+    like calculate_damage; `move_info_fn(move_name)` returns the move's data or None.
+    """
+
+    def __init__(self, challenger_pokemon: dict, opponent_pokemon: dict, damage_fn, move_info_fn, rng=random):
+        self.pokemon = [challenger_pokemon, opponent_pokemon]
+        self.damage_fn = damage_fn
+        self.move_info_fn = move_info_fn
+        self.rng = rng
+        self.turns = 0
+        self.winner = None  # CHALLENGER or OPPONENT once someone faints
+
+        for poke in self.pokemon:
+            if poke["current_hp"] <= 0:
+                poke["current_hp"] = poke["stats"]["HP"]
+
+    @property
+    def game_over(self):
+        return self.winner is not None
+
+    def turn_order(self, challenger_move, opponent_move):
+        """Returns [(side, move), (side, move)], faster Pokémon first (ties are random)."""
+        challenger_speed = self.pokemon[CHALLENGER]["stats"]["Speed"]
+        opponent_speed = self.pokemon[OPPONENT]["stats"]["Speed"]
+
+        if challenger_speed > opponent_speed or (challenger_speed == opponent_speed and self.rng.random() < 0.5):
+            return [(CHALLENGER, challenger_move), (OPPONENT, opponent_move)]
+        return [(OPPONENT, opponent_move), (CHALLENGER, challenger_move)]
+
+    def attack(self, side, move_name):
+        """Applies one attack from `side` and returns its AttackResult."""
+        attacker = self.pokemon[side]
+        defender = self.pokemon[1 - side]
+
+        move_info = self.move_info_fn(move_name)
+        if not move_info:
+            return AttackResult(side, move_name, None)
+
+        damage, type_eff, is_crit, messages = self.damage_fn(attacker, defender, move_name)
+        defender["current_hp"] = max(0, defender["current_hp"] - damage)
+
+        fainted = defender["current_hp"] <= 0
+        if fainted:
+            self.winner = side
+        return AttackResult(side, move_name, move_info, damage, type_eff, is_crit, messages, fainted)
+
+    def resolve_turn(self, challenger_move, opponent_move):
+        """Plays a whole turn. Missing moves (None) are skipped. Returns the AttackResults."""
+        self.turns += 1
+        results = []
+        for side, move_name in self.turn_order(challenger_move, opponent_move):
+            if move_name is None:
+                continue
+            result = self.attack(side, move_name)
+            results.append(result)
+            if result.fainted:
+                break
+        return results
+
+
+# --- Move-choice providers: (state, side) -> move name or None ---
+def random_move_provider(rng=random):
+    """Picks any known move uniformly."""
+    def choose(state, side):
+        moves = state.pokemon[side]["moves"]
+        return rng.choice(moves) if moves else None
+    return choose
+
+
+def strongest_move_provider(expected_power_fn):
+    """Picks the move with the highest `expected_power_fn(attacker, defender, move_name)`."""
+    def choose(state, side):
+        attacker = state.pokemon[side]
+        defender = state.pokemon[1 - side]
+        moves = attacker["moves"]
+        if not moves:
+            return None
+        return max(moves, key=lambda move_name: expected_power_fn(attacker, defender, move_name))
+    return choose
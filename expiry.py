@@ -0,0 +1,71 @@
+import math
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel for lots of cheap, coarse timeouts (despawns, stale challenges).
+    Timers live in `slots` buckets of `tick_seconds` each; advance() only looks at the
+    buckets that came due, so scheduling, rescheduling and cancelling are O(1) and a
+    tick costs O(timers due) no matter how many are pending.
+
+    Each key has at most one live timer: scheduling it again replaces the deadline and
+    cancel() forgets it. Superseded entries are dropped when their bucket comes up.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 512):
+        self.tick_seconds = tick_seconds
+        self.slots = [[] for _ in range(slots)]
+        self.timers = {}  # Key: timer key, Value: (deadline, payload) of the live timer
+        self.current_tick = None  # Last tick advance() has processed
+
+    def _tick_of(self, when: float):
+        return math.floor(when / self.tick_seconds)
+
+    def schedule(self, key, delay: float, now: float, payload=None):
+        """Fires `key` with `payload` once `delay` seconds have passed after `now`."""
+        if self.current_tick is None:
+            self.current_tick = self._tick_of(now)
+        deadline = now + delay
+        tick = max(math.ceil(deadline / self.tick_seconds), self.current_tick + 1)
+        self.timers[key] = (deadline, payload)
+        self.slots[tick % len(self.slots)].append((tick, key, deadline))
+
+    def cancel(self, key):
+        self.timers.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def __len__(self):
+        return len(self.timers)
+
+    def advance(self, now: float):
+        """Returns [(key, payload), ...] for every timer due by `now`, removing them."""
+        if self.current_tick is None:
+            return []
+        target = self._tick_of(now)
+        if target <= self.current_tick:
+            return []
+
+        # After a long stall every bucket is due at most once
+        first = max(self.current_tick + 1, target - len(self.slots) + 1)
+        expired = []
+        for tick in range(first, target + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            if not bucket:
+                continue
+            waiting = []
+            for entry in bucket:
+                entry_tick, key, deadline = entry
+                live = self.timers.get(key)
+                if live is None or live[0] != deadline:
+                    continue  # Cancelled or rescheduled
+                if entry_tick > target:
+                    waiting.append(entry)  # Due on a later lap of the wheel
+                    continue
+                del self.timers[key]
+                expired.append((key, live[1]))
+            self.slots[tick % len(self.slots)] = waiting
+
+        self.current_tick = target
+        return expired
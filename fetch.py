@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+DEFAULT_CACHE_DIR = "api_cache"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ResponseCache:
+    """
+    Raw response bodies on disk, one file per URL, laid out like the URL
+    (api_cache/pokeapi.co/api/v2/pokemon/1.body). An interrupted run resumes
+    from what's already cached, and a cache directory doubles as an offline fixture set.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, url: str):
+        parts = urlsplit(url)
+        relative = parts.path.strip("/") or "index"
+        if parts.query:
+            relative += "_" + parts.query.replace("&", "_").replace("=", "-")
+        return os.path.join(self.directory, parts.netloc, *relative.split("/")) + ".body"
+
+    def get(self, url: str):
+        try:
+            with open(self.path(url), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url: str, body: bytes):
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+
+class Fetcher:
+    """
+    Shared download pipeline for the generate_* scripts: cached, concurrent (at most
+    `concurrency` requests in flight), rate limited, and retried with exponential
+    backoff on timeouts, 429s and 5xx errors. With `offline=True` only the cache is used.
+
+        async with Fetcher() as fetcher:
+            data = await fetcher.get_json("https://pokeapi.co/api/v2/pokemon/1")
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, offline: bool = False, concurrency: int = 8,
+                 rate: float = 20, retries: int = 4, backoff: float = 0.5, timeout: float = 15):
+        self.cache = ResponseCache(cache_dir)
+        self.offline = offline
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = None
+        self.inflight = {}  # URLs being fetched right now, so shared resources are fetched once
+        self.stats = {"cached": 0, "downloaded": 0, "retried": 0}
+
+    @classmethod
+    def from_args(cls, args):
+        """Builds a Fetcher from the options added by add_fetch_arguments()."""
+        return cls(cache_dir=args.cache_dir, offline=args.offline, concurrency=args.concurrency, rate=args.rate)
+
+    async def __aenter__(self):
+        if not self.offline:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.session is not None:
+            await self.session.close()
+
+    async def get_bytes(self, url: str):
+        """Returns the response body for `url`, from the cache if it has been fetched before."""
+        task = self.inflight.get(url)
+        if task is None:
+            task = self.inflight[url] = asyncio.ensure_future(self._get_bytes(url))
+            task.add_done_callback(lambda _: self.inflight.pop(url, None))
+        return await task
+
+    async def _get_bytes(self, url: str):
+        body = await asyncio.to_thread(self.cache.get, url)
+        if body is not None:
+            self.stats["cached"] += 1
+            return body
+        if self.offline:
+            raise FileNotFoundError(f"{url} is not in the offline cache ({self.cache.path(url)})")
+
+        async with self.semaphore:
+            body = await self._download(url)
+        await asyncio.to_thread(self.cache.put, url, body)
+        self.stats["downloaded"] += 1
+        return body
+
+    async def get_json(self, url: str):
+        return json.loads(await self.get_bytes(url))
+
+    async def _download(self, url: str):
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            retry_after = None
+            try:
+                async with self.session.get(url) as response:
+                    if response.status not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return await response.read()
+                    error = aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status, message=response.reason
+                    )
+                    retry_after = response.headers.get("Retry-After")
+            except aiohttp.ClientResponseError:
+                raise  # 4xx other than 429: retrying won't help
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+
+            if attempt == self.retries:
+                raise error
+            self.stats["retried"] += 1
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+            await asyncio.sleep(delay + random.uniform(0, self.backoff))
+
+    def summary(self):
+        return (f"{self.stats['downloaded']} downloaded, {self.stats['cached']} from cache, "
+                f"{self.stats['retried']} retries")
+
+
+def add_fetch_arguments(parser: argparse.ArgumentParser):
+    """Adds the shared --cache-dir / --offline / --concurrency / --rate options to a script."""
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Where responses are cached; a cache directory also works as an offline fixture set")
+    parser.add_argument("--offline", action="store_true", help="Only use the cache, never the network")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument("--rate", type=float, default=20, help="Maximum requests per second")
@@ -0,0 +1,336 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import Mapping
+from functools import lru_cache
+
+from pokemon import MOVES, SPECIES, move_key
+
+BUNDLE_MAGIC = b"MYPOKEGD"
+BUNDLE_VERSION = 4  # Bump whenever the section layout or contents change
+HEADER = struct.Struct("<8sHH")    # magic, version, section count
+SECTION = struct.Struct("<16sQQ")  # name, offset, length
+
+DEFAULT_BUNDLE_FILE = "game_data.bin"
+DEFAULT_SOURCE_FILES = ("pokemon_data.json", "moves.json", "pokedex_data.json")
+RECORD_CACHE_SIZE = 64  # Decoded Pokédex entries kept, so one command doesn't decode a row twice
+
+
+def source_signature(source_files):
+    """(size, mtime) of every source file; a bundle built from other versions of them is stale."""
+    signature = {}
+    for path in source_files:
+        stat = os.stat(path)
+        signature[path] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def _encode(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def pack_table(rows):
+    """
+    A section of variable-length byte rows: the row count, count + 1 offsets into
+    the payload, then the payload. Integers are native uint32, since the bundle is
+    always compiled on the machine that reads it.
+    """
+    offsets = array("I", [len(rows), 0])
+    for row in rows:
+        offsets.append(offsets[-1] + len(row))
+    return offsets.tobytes() + b"".join(rows)
+
+
+class Table:
+    """One pack_table() section, read in place: rows are slices of the mapped file."""
+
+    def __init__(self, section):
+        count = section[:4].cast("I")[0]
+        self.offsets = section[4:4 * (count + 2)].cast("I")
+        self.payload = section[4 * (count + 2):]
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def row(self, i: int):
+        return self.payload[self.offsets[i]:self.offsets[i + 1]]
+
+    def ids(self, i: int):
+        """A row holding uint32 IDs (species → moves, move → learners, type → moves)."""
+        return tuple(self.row(i).cast("I"))
+
+
+class RecordTable(Mapping):
+    """
+    Read-only mapping over a table of JSON records, one row per registry ID (an empty
+    row means no record). Rows are decoded from the shared mapping when looked up
+    instead of being unpacked into every process up front. Only worth it for the large,
+    rarely read Pokédex text; the tables battles read are decoded once (decode_records).
+    """
+
+    def __init__(self, table: Table, keys, registry, decode=json.loads):
+        self.table = table
+        self.keys_by_row = keys  # Canonical key of every row, for iteration
+        self.registry = registry
+        self.decode = decode
+        self.size = sum(1 for _ in self)
+        self.record = lru_cache(maxsize=RECORD_CACHE_SIZE)(self._decode)
+
+    def _decode(self, row: int):
+        return self.decode(bytes(self.table.row(row)))
+
+    def row_of(self, key):
+        """The row for `key` (its registry ID), or None if there's no record."""
+        row = self.registry.get(key) if isinstance(key, str) else None
+        if row is None or row >= len(self.table) or self.table.offsets[row] == self.table.offsets[row + 1]:
+            return None
+        return row
+
+    def __getitem__(self, key):
+        row = self.row_of(key)
+        if row is None:
+            raise KeyError(key)
+        return self.record(row)
+
+    def __contains__(self, key):
+        return self.row_of(key) is not None
+
+    def __iter__(self):
+        offsets = self.table.offsets
+        return (key for row, key in enumerate(self.keys_by_row) if offsets[row] != offsets[row + 1])
+
+    def __len__(self):
+        return self.size
+
+
+def decode_records(table: Table, keys, decode=json.loads):
+    """Every record of a table as a plain dict keyed like RecordTable (rows without a record are left out)."""
+    return {key: decode(bytes(table.row(row))) for row, key in enumerate(keys)
+            if table.offsets[row] != table.offsets[row + 1]}
+
+
+class GameBundle:
+    """
+    All static game data (pokemon_data.json, moves.json, pokedex_data.json) compiled
+    into one versioned binary file that is memory-mapped and read in place, so worker
+    processes share its pages. Species and moves are numbered by pokemon.SPECIES and
+    pokemon.MOVES (the bundle seeds them in its own order), and every table is indexed
+    by those IDs: species → record, learnset, evolution line, Pokédex entry, artwork;
+    move → record, learners; type → moves.
+    """
+
+    def __init__(self, buffer, bundle_map=None):
+        self.buffer = buffer  # memoryview over the whole file (the mmap, or bytes from compile())
+        self.map = bundle_map
+        magic, version, count = HEADER.unpack_from(buffer, 0)
+        if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+            raise ValueError("not a game-data bundle of this version")
+        self.sections = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(buffer, HEADER.size + i * SECTION.size)
+            self.sections[name.rstrip(b"\0").decode()] = buffer[offset:offset + length]
+        self.meta = json.loads(bytes(self.sections["meta"]))
+
+    # --- Building ---
+    @classmethod
+    def compile(cls, pokemon_file: str, moves_file: str, pokedex_file: str):
+        """Builds a bundle straight from the JSON files."""
+        loaded = []
+        for path in (pokemon_file, moves_file, pokedex_file):
+            with open(path, "r", encoding="utf-8") as f:
+                loaded.append(json.load(f))
+        pokemon_data, moves_data, pokedex_data = loaded
+        moves_data = {move_key(key): data for key, data in moves_data.items()}
+
+        # Every move in moves.json, plus any learnset move it's missing. Display names come
+        # from the learnsets ("Solar Beam"); moves no species learns get a readable one.
+        move_names = {}
+        for data in pokemon_data.values():
+            for name in data.get("moves", []):
+                move_names.setdefault(move_key(name), name)
+        for key in moves_data:
+            move_names.setdefault(key, key.replace("-", " ").title())
+        moves = list(move_names.values())
+        move_index = {key: i for i, key in enumerate(move_names)}
+
+        species = list(pokemon_data)
+        species_moves = []
+        pokemon_rows = []
+        for data in pokemon_data.values():
+            learnset = [move_index[move_key(name)] for name in data.get("moves", [])]
+            species_moves.append(list(dict.fromkeys(learnset)))
+            pokemon_rows.append(_encode(dict(data, moves=[moves[move_id] for move_id in learnset])))
+
+        move_learners = [[] for _ in moves]
+        for species_id, move_ids in enumerate(species_moves):
+            for move_id in move_ids:
+                move_learners[move_id].append(species_id)
+
+        # Whole evolution line per species, from the Pokédex text ("Bulbasaur → Ivysaur (Lv.16) → ...")
+        species_index = {name: i for i, name in enumerate(species)}
+        evolution = []
+        for name in species:
+            stages = pokedex_data.get(name, {}).get("evolution", "").split("→")
+            line = [species_index[stage] for stage in (s.split("(")[0].strip().lower() for s in stages)
+                    if stage in species_index]
+            evolution.append(line if len(line) > 1 else [])
+
+        types = sorted({t.lower() for data in pokemon_data.values() for t in data.get("types", [])}
+                       | {data.get("type", "normal").lower() for data in moves_data.values()})
+        type_index = {type_name: i for i, type_name in enumerate(types)}
+        moves_by_type = [[] for _ in types]
+        for key, data in moves_data.items():
+            moves_by_type[type_index[data.get("type", "normal").lower()]].append(move_index[key])
+
+        meta = {
+            "sources": source_signature((pokemon_file, moves_file, pokedex_file)),
+            "species": species,
+            "moves": moves,
+            "types": types,
+        }
+        sections = {
+            "meta": _encode(meta),
+            "pokemon": pack_table(pokemon_rows),
+            "moves": pack_table([_encode(moves_data[key]) if key in moves_data else b"" for key in move_names]),
+            # Artwork is needed all the time (spawns, battles), the rest of the Pokédex rarely
+            "pokedex": pack_table([_encode(pokedex_data[name]) if name in pokedex_data else b""
+                                   for name in species]),
+            "image_urls": pack_table([pokedex_data.get(name, {}).get("image_url", "").encode() for name in species]),
+            "species_moves": pack_table([array("I", ids).tobytes() for ids in species_moves]),
+            "move_learners": pack_table([array("I", ids).tobytes() for ids in move_learners]),
+            "moves_by_type": pack_table([array("I", ids).tobytes() for ids in moves_by_type]),
+            "evolution": pack_table([array("I", ids).tobytes() for ids in evolution]),
+        }
+        return cls(memoryview(cls.pack(sections))).register()
+
+    @staticmethod
+    def pack(sections: dict):
+        """Header, section table, then every section padded to 4 bytes so its integers can be read in place."""
+        header_size = HEADER.size + SECTION.size * len(sections)
+        offset = header_size + -header_size % 4
+        table = []
+        padded = []
+        for name, payload in sections.items():
+            table.append(SECTION.pack(name.encode(), offset, len(payload)))
+            padded.append(payload + b"\0" * (-len(payload) % 4))
+            offset += len(padded[-1])
+
+        header = HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(sections)) + b"".join(table)
+        return header + b"\0" * (-len(header) % 4) + b"".join(padded)
+
+    def save(self, bundle_file: str):
+        """Writes the bundle atomically, so workers starting at the same time never see half a file."""
+        tmp_file = f"{bundle_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(self.buffer)
+        os.replace(tmp_file, bundle_file)
+
+    # --- Loading ---
+    @classmethod
+    def load(cls, bundle_file: str, source_files=DEFAULT_SOURCE_FILES):
+        """Returns the bundle, or None if it's missing, from another version, or older than its sources."""
+        if not os.path.exists(bundle_file):
+            return None
+        with open(bundle_file, "rb") as f:
+            try:
+                bundle_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file
+                return None
+
+        try:
+            bundle = cls(memoryview(bundle_map), bundle_map)
+            if bundle.meta["sources"] != source_signature(source_files):
+                return None
+        except (struct.error, ValueError, KeyError):
+            return None
+        return bundle.register()
+
+    def register(self):
+        """Seeds pokemon.SPECIES / pokemon.MOVES in bundle order and opens the tables. Returns self."""
+        SPECIES.seed(self.meta["species"])
+        MOVES.seed(self.meta["moves"])
+        species = self.meta["species"]
+        self.type_index = {type_name: i for i, type_name in enumerate(self.meta["types"])}
+        move_keys = [move_key(name) for name in self.meta["moves"]]
+
+        # Small and read every battle turn: decoded once per process into plain dicts
+        self.pokemon_data = decode_records(Table(self.sections["pokemon"]), species)
+        self.moves_data = decode_records(Table(self.sections["moves"]), move_keys)  # Keyed like moves.json
+        # Learnsets spell moves by display name ("Vine Whip"); both spellings resolve in one probe
+        self.move_lookup = dict(self.moves_data)
+        for name, key in zip(self.meta["moves"], move_keys):
+            if key in self.moves_data:
+                self.move_lookup.setdefault(name, self.moves_data[key])
+        self.image_urls = decode_records(Table(self.sections["image_urls"]), species, decode=bytes.decode)
+
+        self.pokedex_data = RecordTable(Table(self.sections["pokedex"]), species, SPECIES)
+        self.move_learners = Table(self.sections["move_learners"])
+        self.moves_by_type = Table(self.sections["moves_by_type"])
+
+        species_moves = Table(self.sections["species_moves"])
+        evolution = Table(self.sections["evolution"])
+        self.learnsets = {name: species_moves.ids(i) for i, name in enumerate(species)}
+        self.learnable = {name: frozenset(move_ids) for name, move_ids in self.learnsets.items()}
+        self.evolution = {name: tuple(species[member] for member in evolution.ids(i))
+                          for i, name in enumerate(species)}
+        return self
+
+    # --- Cross-references ---
+    def learnset(self, species_name: str):
+        """IDs (in pokemon.MOVES) of the moves a species can learn, in learnset order."""
+        return self.learnsets.get(species_name, ())
+
+    def can_learn(self, species_name: str, move_id):
+        """Whether a species can learn the move with this ID (in pokemon.MOVES)."""
+        return move_id in self.learnable.get(species_name, ())
+
+    def learners(self, move_name: str):
+        """Species that can learn a move, in Pokédex order."""
+        move_id = MOVES.get(move_name)
+        if move_id is None or move_id >= len(self.move_learners):
+            return ()
+        return tuple(SPECIES.names[species_id] for species_id in self.move_learners.ids(move_id))
+
+    def moves_of_type(self, type_name: str):
+        """IDs (in pokemon.MOVES) of the moves of one type ("fire", "Fire")."""
+        type_id = self.type_index.get(type_name.lower())
+        return () if type_id is None else self.moves_by_type.ids(type_id)
+
+    def evolution_line(self, species_name: str):
+        """Every species in this one's evolution line, in order, or () if it doesn't evolve."""
+        return self.evolution.get(species_name, ())
+
+    def image_url(self, species_name: str):
+        """Official artwork URL, or "" if unknown. Doesn't decode the Pokédex entry."""
+        return self.image_urls.get(species_name, "")
+
+
+def ensure_bundle(bundle_file: str = DEFAULT_BUNDLE_FILE, source_files=DEFAULT_SOURCE_FILES):
+    """Loads the bundle, recompiling (and rewriting) it first if it's missing or stale."""
+    bundle = GameBundle.load(bundle_file, source_files)
+    if bundle is not None:
+        return bundle
+
+    print(f"Compiling {bundle_file} from {', '.join(source_files)}...")
+    bundle = GameBundle.compile(*source_files)
+    try:
+        bundle.save(bundle_file)
+    except OSError as e:
+        print(f"✗ Couldn't write {bundle_file}: {e}")
+    return bundle
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compiles the game-data JSON files into one binary bundle.")
+    parser.add_argument("--output", default=DEFAULT_BUNDLE_FILE)
+    args = parser.parse_args()
+
+    bundle = GameBundle.compile(*DEFAULT_SOURCE_FILES)
+    bundle.save(args.output)
+    meta = bundle.meta
+    print(f"✅ Wrote {args.output}: {len(meta['species'])} species, {len(meta['moves'])} moves, "
+          f"{len(meta['types'])} types ({os.path.getsize(args.output)} bytes)")
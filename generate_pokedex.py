@@ -1,142 +1,192 @@
-import requests
+import argparse
+import asyncio
 import json
-import time
+from io import BytesIO
+from PIL import Image
+from fetch import Fetcher, add_fetch_arguments
+from sprites import resize_to_height, write_sprite_atlas
 
-def generate_kanto_pokedex():
+# Must match the battle image height used by the bot (SpriteCache default)
+ATLAS_SPRITE_HEIGHT = 300
+
+def generate_kanto_pokedex(fetcher: Fetcher = None):
     """
     Fetches data for all 151 Kanto Pokémon from PokéAPI
     and generates a pokedex_data.json file.
     """
-    pokedex = {}
-
-    print("Fetching Kanto Pokémon data from PokéAPI...")
-    print("This may take a few minutes...\n")
+    asyncio.run(_generate_kanto_pokedex(fetcher or Fetcher()))
 
-    # Kanto region: Pokémon #1-151
-    for pokemon_id in range(1, 152):
-        try:
-            # Fetch Pokémon data
-            response = requests.get(f"https://pokeapi.co/api/v2/pokemon/{pokemon_id}")
-            pokemon_data = response.json()
-
-            # Fetch species data for description and evolution
-            species_response = requests.get(f"https://pokeapi.co/api/v2/pokemon-species/{pokemon_id}")
-            species_data = species_response.json()
-
-            # Get English name
-            name = pokemon_data["name"]
-
-            # Get types
-            types = [t["type"]["name"].capitalize() for t in pokemon_data["types"]]
-
-            # Get stats
-            stats = {}
-            for stat in pokemon_data["stats"]:
-                stat_name = stat["stat"]["name"]
-                if stat_name == "hp":
-                    stats["hp"] = stat["base_stat"]
-                elif stat_name == "attack":
-                    stats["attack"] = stat["base_stat"]
-                elif stat_name == "defense":
-                    stats["defense"] = stat["base_stat"]
-                elif stat_name == "special-attack":
-                    stats["sp_atk"] = stat["base_stat"]
-                elif stat_name == "special-defense":
-                    stats["sp_def"] = stat["base_stat"]
-                elif stat_name == "speed":
-                    stats["speed"] = stat["base_stat"]
-
-            # Get abilities
-            abilities = [a["ability"]["name"].replace("-", " ").title() 
-                        for a in pokemon_data["abilities"]]
-
-            # Get height (decimeters to meters)
-            height = f"{pokemon_data['height'] / 10:.1f} m"
-
-            # Get weight (hectograms to kg)
-            weight = f"{pokemon_data['weight'] / 10:.1f} kg"
-
-            # Get English description
-            description = "A mysterious Pokémon."
-            for entry in species_data["flavor_text_entries"]:
-                if entry["language"]["name"] == "en":
-                    description = entry["flavor_text"].replace("\n", " ").replace("\f", " ")
-                    break
-
-            # Get category/genus
-            category = "Unknown Pokémon"
-            for genus in species_data["genera"]:
-                if genus["language"]["name"] == "en":
-                    category = genus["genus"]
-                    break
-
-            # Get gender ratio
-            gender_rate = species_data["gender_rate"]
-            if gender_rate == -1:
-                gender_ratio = "Genderless"
-            else:
-                female_percent = (gender_rate / 8) * 100
-                male_percent = 100 - female_percent
-                gender_ratio = f"♂ {male_percent:.1f}% / ♀ {female_percent:.1f}%"
-
-            # Get evolution chain (simplified)
-            evolution = "Does not evolve"
-            try:
-                evo_chain_url = species_data["evolution_chain"]["url"]
-                evo_response = requests.get(evo_chain_url)
-                evo_data = evo_response.json()
-
-                # Build evolution chain
-                chain = []
-                current = evo_data["chain"]
-
-                while current:
-                    chain.append(current["species"]["name"].capitalize())
-                    if current["evolves_to"]:
-                        current = current["evolves_to"][0]
-                    else:
-                        current = None
-
-                if len(chain) > 1:
-                    evolution = " → ".join(chain)
-            except:
-                pass
-
-            # Official artwork URL
-            image_url = f"https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/other/official-artwork/{pokemon_id}.png"
-
-            # Build Pokémon entry
-            pokedex[name] = {
-                "number": pokemon_id,
-                "name": name.capitalize(),
-                "types": types,
-                "category": category,
-                "height": height,
-                "weight": weight,
-                "description": description,
-                "abilities": abilities,
-                "gender_ratio": gender_ratio,
-                "base_stats": stats,
-                "evolution": evolution,
-                "generation": 1,
-                "image_url": image_url
-            }
-
-            print(f"✓ #{pokemon_id:03d} {name.capitalize()}")
-
-            # Be respectful to the API - small delay
-            time.sleep(0.5)
+async def _generate_kanto_pokedex(fetcher: Fetcher):
+    print("Fetching Kanto Pokémon data from PokéAPI...\n")
 
-        except Exception as e:
-            print(f"✗ Error fetching #{pokemon_id}: {e}")
-            continue
+    # Kanto region: Pokémon #1-151, fetched concurrently
+    async with fetcher:
+        entries = await asyncio.gather(*(fetch_pokedex_entry(fetcher, pokemon_id) for pokemon_id in range(1, 152)))
+    pokedex = dict(entry for entry in entries if entry is not None)
 
     # Save to file
     with open("pokedex_data.json", "w", encoding="utf-8") as f:
         json.dump(pokedex, f, indent=2, ensure_ascii=False)
 
     print(f"\n✅ Successfully generated pokedex_data.json with {len(pokedex)} Pokémon!")
+    print(f"Requests: {fetcher.summary()}")
     print("File saved in the current directory.")
 
+async def fetch_pokedex_entry(fetcher: Fetcher, pokemon_id: int):
+    """Returns (name, Pokédex entry) for one Pokémon, or None if it couldn't be fetched."""
+    try:
+        # Fetch Pokémon data and species data (description and evolution) together
+        pokemon_data, species_data = await asyncio.gather(
+            fetcher.get_json(f"https://pokeapi.co/api/v2/pokemon/{pokemon_id}"),
+            fetcher.get_json(f"https://pokeapi.co/api/v2/pokemon-species/{pokemon_id}"),
+        )
+
+        # Get English name
+        name = pokemon_data["name"]
+
+        # Get types
+        types = [t["type"]["name"].capitalize() for t in pokemon_data["types"]]
+
+        # Get stats
+        stats = {}
+        for stat in pokemon_data["stats"]:
+            stat_name = stat["stat"]["name"]
+            if stat_name == "hp":
+                stats["hp"] = stat["base_stat"]
+            elif stat_name == "attack":
+                stats["attack"] = stat["base_stat"]
+            elif stat_name == "defense":
+                stats["defense"] = stat["base_stat"]
+            elif stat_name == "special-attack":
+                stats["sp_atk"] = stat["base_stat"]
+            elif stat_name == "special-defense":
+                stats["sp_def"] = stat["base_stat"]
+            elif stat_name == "speed":
+                stats["speed"] = stat["base_stat"]
+
+        # Get abilities
+        abilities = [a["ability"]["name"].replace("-", " ").title() 
+                    for a in pokemon_data["abilities"]]
+
+        # Get height (decimeters to meters)
+        height = f"{pokemon_data['height'] / 10:.1f} m"
+
+        # Get weight (hectograms to kg)
+        weight = f"{pokemon_data['weight'] / 10:.1f} kg"
+
+        # Get English description
+        description = "A mysterious Pokémon."
+        for entry in species_data["flavor_text_entries"]:
+            if entry["language"]["name"] == "en":
+                description = entry["flavor_text"].replace("\n", " ").replace("\f", " ")
+                break
+
+        # Get category/genus
+        category = "Unknown Pokémon"
+        for genus in species_data["genera"]:
+            if genus["language"]["name"] == "en":
+                category = genus["genus"]
+                break
+
+        # Get gender ratio
+        gender_rate = species_data["gender_rate"]
+        if gender_rate == -1:
+            gender_ratio = "Genderless"
+        else:
+            female_percent = (gender_rate / 8) * 100
+            male_percent = 100 - female_percent
+            gender_ratio = f"♂ {male_percent:.1f}% / ♀ {female_percent:.1f}%"
+
+        # Get evolution chain (simplified). Chains are shared by a whole family,
+        # so the fetcher only downloads each one once.
+        evolution = "Does not evolve"
+        try:
+            evo_data = await fetcher.get_json(species_data["evolution_chain"]["url"])
+
+            # Build evolution chain
+            chain = []
+            current = evo_data["chain"]
+
+            while current:
+                chain.append(current["species"]["name"].capitalize())
+                if current["evolves_to"]:
+                    current = current["evolves_to"][0]
+                else:
+                    current = None
+
+            if len(chain) > 1:
+                evolution = " → ".join(chain)
+        except:
+            pass
+
+        # Official artwork URL
+        image_url = f"https://raw.githubusercontent.com/PokeAPI/sprites/master/sprites/pokemon/other/official-artwork/{pokemon_id}.png"
+
+        print(f"✓ #{pokemon_id:03d} {name.capitalize()}")
+
+        # Build Pokémon entry
+        return name, {
+            "number": pokemon_id,
+            "name": name.capitalize(),
+            "types": types,
+            "category": category,
+            "height": height,
+            "weight": weight,
+            "description": description,
+            "abilities": abilities,
+            "gender_ratio": gender_ratio,
+            "base_stats": stats,
+            "evolution": evolution,
+            "generation": 1,
+            "image_url": image_url
+        }
+
+    except Exception as e:
+        print(f"✗ Error fetching #{pokemon_id}: {e}")
+        return None
+
+def build_sprite_atlas(pokedex_file="pokedex_data.json", atlas_file="sprite_atlas.bin", index_file="sprite_atlas.json",
+                       fetcher: Fetcher = None):
+    """
+    Downloads every sprite referenced by pokedex_data.json once, resizes it to the
+    battle height and packs them all into one atlas file plus an offset index.
+    """
+    asyncio.run(_build_sprite_atlas(pokedex_file, atlas_file, index_file, fetcher or Fetcher()))
+
+async def _build_sprite_atlas(pokedex_file, atlas_file, index_file, fetcher: Fetcher):
+    with open(pokedex_file, "r", encoding="utf-8") as f:
+        pokedex = json.load(f)
+
+    print(f"Building sprite atlas for {len(pokedex)} Pokémon...\n")
+
+    async def fetch_sprite(name, entry):
+        try:
+            raw = await fetcher.get_bytes(entry["image_url"])
+            image = Image.open(BytesIO(raw)).convert('RGBA')
+            sprite = resize_to_height(image, ATLAS_SPRITE_HEIGHT)
+            print(f"✓ #{entry['number']:03d} {name.capitalize()} ({sprite.width}x{ATLAS_SPRITE_HEIGHT})")
+            return name, sprite
+        except Exception as e:
+            print(f"✗ Error fetching sprite for {name}: {e}")
+            return None
+
+    async with fetcher:
+        results = await asyncio.gather(*(fetch_sprite(name, entry) for name, entry in pokedex.items()))
+    sprites = dict(result for result in results if result is not None)
+
+    write_sprite_atlas(sprites, atlas_file, index_file, ATLAS_SPRITE_HEIGHT)
+
+    print(f"\n✅ Packed {len(sprites)} sprites into {atlas_file} (index: {index_file})")
+    print(f"Requests: {fetcher.summary()}")
+
 if __name__ == "__main__":
-    generate_kanto_pokedex()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generates pokedex_data.json (and optionally the sprite atlas) from PokéAPI.")
+    parser.add_argument("--atlas", action="store_true", help="Also build the sprite atlas")
+    parser.add_argument("--atlas-only", action="store_true", help="Only build the sprite atlas from the existing pokedex_data.json")
+    add_fetch_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.atlas_only:
+        generate_kanto_pokedex(Fetcher.from_args(args))
+    if args.atlas or args.atlas_only:
+        build_sprite_atlas(fetcher=Fetcher.from_args(args))
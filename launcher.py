@@ -0,0 +1,69 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+
+from gamedata import ensure_bundle
+from storage import SqliteBackend, TrainerStore
+
+TRAINER_DB_FILE = "trainers.db"
+USER_DATA_FILE = "user_data.json"
+USER_BALANCE_FILE = "user_balance.json"
+
+
+def shard_ranges(shards: int, workers: int):
+    """Splits shard IDs 0..shards-1 into `workers` contiguous, near-equal ranges."""
+    per_worker, extra = divmod(shards, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        size = per_worker + (1 if worker < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def import_legacy_data():
+    """Imports the old single-file saves before any worker starts, so they don't race on it."""
+    store = TrainerStore(SqliteBackend(TRAINER_DB_FILE), background=False)
+    if store.backend.is_empty() and os.path.exists(USER_DATA_FILE):
+        try:
+            imported = store.import_legacy_files(USER_DATA_FILE, USER_BALANCE_FILE)
+            print(f"Imported {imported} trainers from {USER_DATA_FILE} into {TRAINER_DB_FILE}")
+        except (ValueError, KeyError) as e:
+            print(f"✗ Couldn't import {USER_DATA_FILE}, nothing was imported (will retry next start): {e}")
+    store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the bot as several processes, each owning a range of gateway shards.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, default=None, help="Total gateway shards (default: one per worker)")
+    args = parser.parse_args()
+
+    shards = args.shards or args.workers
+    workers = min(args.workers, shards)
+    import_legacy_data()
+    ensure_bundle()  # Compile the game data once here rather than in every worker at the same time
+
+    processes = []
+    for shard_ids in shard_ranges(shards, workers):
+        env = dict(os.environ, SHARD_COUNT=str(shards), SHARD_IDS=",".join(map(str, shard_ids)))
+        print(f"Starting worker for shards {shard_ids[0]}-{shard_ids[-1]} of {shards}")
+        processes.append(subprocess.Popen([sys.executable, "main.py"], env=env))
+
+    def stop(signum, frame):
+        # SIGINT makes bot.run return normally, so each worker saves before exiting
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        # Ctrl+C already reached the workers (same process group); just wait for them
+        for process in processes:
+            process.wait()
@@ -1,14 +1,24 @@
 import discord
 from discord.ext import commands, tasks
 import os
-import json
 import random
 from dotenv import load_dotenv
 from keep_alive import keep_alive
 import asyncio
-from PIL import Image
-import requests
+from collections import deque
 from io import BytesIO
+from storage import Journal, JsonShardBackend, SharedInbox, SqliteBackend, TrainerStore
+from sprites import SpriteAtlas, SpriteCache
+from battle_engine import CHALLENGER, OPPONENT, BattleState
+from pokemon import IVs, MOVES, SPECIES, Pokemon, derived_stats, move_key, set_base_stats
+from expiry import TimerWheel
+from gamedata import ensure_bundle
+from team_index import TEAM_SORTS, TeamIndex
+
+try:
+    import numpy as np
+except ImportError:  # Only needed by calculate_damage_batch (simulations / balance analysis)
+    np = None
 
 
 # --- Basic Setup ---
@@ -16,7 +26,20 @@ load_dotenv()
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True # Required to get user objects from mentions
-bot = commands.Bot(command_prefix="!", intents=intents)
+
+# Multi-process mode (see launcher.py): each worker runs the gateway shards listed in
+# SHARD_IDS out of SHARD_COUNT. Guild state (spawns, battles, activity) stays in the
+# worker that owns the guild; trainer data goes through the shared SQLite store.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",") if shard_id.strip()]
+SHARDED = SHARD_COUNT > 0
+if SHARDED:
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents,
+                                  shard_count=SHARD_COUNT, shard_ids=SHARD_IDS or None)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents)
+# Discord delivers every DM to shard 0, so only its owner sees battle moves sent by DM
+OWNS_DM_SHARD = not SHARDED or not SHARD_IDS or 0 in SHARD_IDS
 # Add this line to disable the default help command
 bot.help_command = None
 
@@ -27,7 +50,8 @@ async def help(ctx):
     embed.add_field(name="!choose <pokemon>", value="Choose your starter Pokémon (bulbasaur, charmander, squirtle).",
                     inline=False)
     embed.add_field(name="!info", value="Show details of your selected Pokémon.", inline=False)
-    embed.add_field(name="!team", value="Show your Pokémon team.", inline=False)
+    embed.add_field(name="!team [page] [level|iv|name] [species]", value="Show your Pokémon team, sorted or filtered.",
+                    inline=False)
     embed.add_field(name="!select <position>", value="Select a Pokémon from your team.", inline=False)
     embed.add_field(name="!battle <opponent>", value="Challenge another player to a battle.", inline=False)
     embed.add_field(name="!accept", value="Accept a battle challenge.", inline=False)
@@ -40,8 +64,29 @@ async def help(ctx):
 USER_DATA_FILE = "user_data.json"
 POKEMON_DATA_FILE = "pokemon_data.json"
 MOVES_DATA_FILE = "moves.json"
+POKEDEX_DATA_FILE = "pokedex_data.json"
+GAME_DATA_BUNDLE_FILE = "game_data.bin"  # Compiled from the JSON game data; rebuilt whenever it changes
 USER_BALANCE_FILE = "user_balance.json"
-SAVE_INTERVAL_SECONDS = 60
+TRAINER_DATA_DIR = "trainers"  # One JSON file per trainer, only changed ones are rewritten
+TRAINER_DB_FILE = "trainers.db"
+# "json" or "sqlite"; workers share one database, so sharded mode always uses sqlite
+STORAGE_BACKEND = "sqlite" if SHARDED else os.getenv("STORAGE_BACKEND", "json")
+# Crash-safe log of economy changes between saves (one per worker when sharded)
+JOURNAL_FILE = f"trainers-w{min(SHARD_IDS, default=0)}.journal" if SHARDED else "trainers.journal"
+JOURNAL_FSYNC_INTERVAL = 0.2  # Seconds; upper bound on what a crash can lose
+# Shared storage is saved more often so other workers see changes sooner
+SAVE_INTERVAL_SECONDS = 5 if SHARDED else 60
+# Cached trainers unused for this long are dropped and re-read from the shared store.
+# Longer than any command keeps a trainer around (e.g. !learn's 30s prompt).
+SHARED_CACHE_IDLE_SECONDS = 60
+TEAM_PAGE_SIZE = 25  # Pokémon per !team page (three inline fields stay under Discord's limits)
+TEAM_INDEX_IDLE_SECONDS = 600  # !team summaries not viewed for this long are dropped
+DM_INBOX_POLL_SECONDS = 1
+SPRITE_CACHE_DIR = "sprite_cache"  # Resized battle sprites, one PNG per Pokémon
+SPRITE_ATLAS_FILE = "sprite_atlas.bin"  # Optional, built with: python generate_pokedex.py --atlas
+SPRITE_ATLAS_INDEX_FILE = "sprite_atlas.json"
+BATTLE_IMAGE_BUDGET_SECONDS = 2.5  # Past this, fall back to the two-URL embed
+MOVE_SELECTION_SECONDS = 10  # Turn deadline; the turn starts early once both players chose
 POKEBALL_EMOJIS = {
     "pokeball": "<:pokeball:1434234039363178577>",      # Replace with actual ID
     "greatball": "<:pokeball1:1434234047332221151>",    # Replace with actual ID
@@ -69,11 +114,30 @@ TYPE_CHART = {
     "steel": {"fire": 0.5, "water": 0.5, "electric": 0.5, "ice": 2, "rock": 2, "steel": 0.5, "fairy": 2},
     "fairy": {"fire": 0.5, "fighting": 2, "poison": 0.5, "dragon": 2, "dark": 2, "steel": 0.5}
 }
+
+# Dense form of TYPE_CHART: each type gets a small integer and
+# TYPE_MATRIX[attacking_type_id][defending_type_id] is the multiplier
+TYPE_NAMES = list(TYPE_CHART)
+TYPE_INDEX = {type_name: i for i, type_name in enumerate(TYPE_NAMES)}
+TYPE_MATRIX = [
+    [TYPE_CHART[attacking].get(defending, 1.0) for defending in TYPE_NAMES]
+    for attacking in TYPE_NAMES
+]
 # Spawn system constants
 SPAWN_BASE_MESSAGES = 35  # Base messages needed for spawn
 SPAWN_ACTIVE_THRESHOLD = 5  # Users active in last 5 minutes
 SPAWN_ACTIVE_MESSAGES = 25  # Messages needed when server is active
+ACTIVE_USER_WINDOW_SECONDS = 300  # A user counts as active for 5 minutes after a message
 MAX_CATCH_ATTEMPTS = 3
+SPAWN_DESPAWN_SECONDS = 300  # Uncaught wild Pokémon run away after 5 minutes
+CHALLENGE_TIMEOUT_SECONDS = 60  # Unaccepted battle challenges are cancelled
+SPAWN_TRACKER_IDLE_SECONDS = 3600  # Channels silent for an hour lose their message count
+EXPIRY_TICK_SECONDS = 1
+
+# XP system constants
+XP_PER_MESSAGE = 5
+XP_PER_LEVEL = 100
+XP_FLUSH_INTERVAL_SECONDS = 30  # Chat XP is applied (and level-ups announced) once per window
 
 # Pokemon rarity configuration
 RARITY_TIERS = {
@@ -115,6 +179,12 @@ RARITY_TIERS = {
     }
 }
 
+# Spawn tables in the same shape as RARITY_TIERS (only "spawn_weight" and "pokemon" are
+# used). Extra tables, e.g. a "cave" biome, can be added here and given to guilds below;
+# a Pokémon's catch rarity always comes from RARITY_TIERS.
+SPAWN_TABLES = {"default": RARITY_TIERS}
+GUILD_SPAWN_TABLES = {}  # Key: guild_id, Value: name of a table in SPAWN_TABLES
+
 # Evolution data
 EVOLUTION_DATA = {
     "bulbasaur": {"evolves_to": "ivysaur", "level": 16},
@@ -152,10 +222,103 @@ EVOLUTION_DATA = {
     "dragonair": {"evolves_to": "dragonite", "level": 55}
 }
 
+class ActivityTracker:
+    """
+    Counts distinct users active in each guild over a sliding time window.
+    Each message is appended to a per-guild deque and dropped once (lazily) when it
+    ages out, so updates are amortized O(1) and the active count is a len().
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.guilds = {}  # Key: guild_id, Value: (deque of (time, user_id), {user_id: last_seen})
+
+    def _expire(self, guild_id, now: float):
+        events, last_seen = self.guilds[guild_id]
+        cutoff = now - self.window_seconds
+        while events and events[0][0] <= cutoff:
+            seen_at, user_id = events.popleft()
+            # Only forget the user if this was their most recent message
+            if last_seen.get(user_id) == seen_at:
+                del last_seen[user_id]
+        if not events:
+            del self.guilds[guild_id]
+
+    def touch(self, guild_id, user_id, now: float):
+        """Records a message from `user_id` in `guild_id` at time `now`."""
+        if guild_id not in self.guilds:
+            self.guilds[guild_id] = (deque(), {})
+        events, last_seen = self.guilds[guild_id]
+        events.append((now, user_id))
+        last_seen[user_id] = now
+        self._expire(guild_id, now)
+
+    def active_count(self, guild_id, now: float):
+        """Number of distinct users who sent a message in the last window."""
+        if guild_id not in self.guilds:
+            return 0
+        self._expire(guild_id, now)
+        return len(self.guilds[guild_id][1]) if guild_id in self.guilds else 0
+
+
 # Global spawn tracking
 spawn_tracker = {}
-active_users = {}
+active_users = ActivityTracker(ACTIVE_USER_WINDOW_SECONDS)
 spawned_pokemon = {}
+# Despawns, challenge timeouts and idle spawn trackers. Keys are ("spawn", channel_id),
+# ("challenge", channel.id) and ("tracker", channel_id); see expire_timers()
+expiry_wheel = TimerWheel(EXPIRY_TICK_SECONDS)
+pending_xp = {}  # Key: user_id, Value: {"xp", "channel", "member"} accrued since the last XP flush
+
+
+class SpawnTable:
+    """
+    Weighted Pokémon sampler compiled once from a tier config (Walker's alias method):
+    every spawn costs one random number and two list lookups, however many species.
+    """
+
+    def __init__(self, tiers: dict, available):
+        self.names = []
+        weights = []
+        for data in tiers.values():
+            for poke in data["pokemon"]:
+                if poke in available and data["spawn_weight"] > 0:  # Only spawn if we have data
+                    self.names.append(poke)
+                    weights.append(data["spawn_weight"])
+
+        count = len(weights)
+        total = sum(weights)
+        scaled = [weight * count / total for weight in weights]
+        self.prob = [1.0] * count
+        self.alias = list(range(count))
+
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            low = small.pop()
+            high = large.pop()
+            self.prob[low] = scaled[low]
+            self.alias[low] = high
+            scaled[high] -= 1 - scaled[low]
+            (small if scaled[high] < 1 else large).append(high)
+
+    def sample(self, rng=random):
+        """Returns a random Pokémon name, or None if the table is empty."""
+        if not self.names:
+            return None
+        u = rng.random() * len(self.names)
+        column = int(u)
+        if u - column < self.prob[column]:
+            return self.names[column]
+        return self.names[self.alias[column]]
+
+    def __len__(self):
+        return len(self.names)
+
+
+# Compiled by build_spawn_tables() whenever pokemon_data loads
+spawn_tables = {}  # Key: table name, Value: SpawnTable
+pokemon_rarity = {}  # Key: pokemon name, Value: rarity tier
 
 
 # ============================================
@@ -163,12 +326,20 @@ spawned_pokemon = {}
 # Add these after your existing helper functions
 # ============================================
 
+def build_spawn_tables():
+    """Compiles every spawn table and the name -> rarity lookup from the tier config."""
+    global spawn_tables, pokemon_rarity
+
+    spawn_tables = {name: SpawnTable(tiers, pokemon_data) for name, tiers in SPAWN_TABLES.items()}
+
+    pokemon_rarity = {}
+    for rarity, data in RARITY_TIERS.items():
+        for poke in data["pokemon"]:
+            pokemon_rarity.setdefault(poke, rarity)  # First tier wins, like the old scan
+
 def get_pokemon_rarity(pokemon_name):
     """Returns the rarity tier of a pokemon."""
-    for rarity, data in RARITY_TIERS.items():
-        if pokemon_name in data["pokemon"]:
-            return rarity
-    return "common"
+    return pokemon_rarity.get(pokemon_name, "common")
 
 def get_required_ball(rarity):
     """Returns the required ball type for a rarity."""
@@ -178,21 +349,12 @@ def get_catch_rate(rarity):
     """Returns the catch rate for a rarity."""
     return RARITY_TIERS[rarity]["catch_rate"]
 
-def spawn_random_pokemon():
-    """Spawns a random pokemon based on weighted rarity."""
-    weights = []
-    pokemon_pool = []
-
-    for rarity, data in RARITY_TIERS.items():
-        for poke in data["pokemon"]:
-            if poke in pokemon_data:  # Only spawn if we have data
-                weights.append(data["spawn_weight"])
-                pokemon_pool.append(poke)
-
-    if not pokemon_pool:
+def spawn_random_pokemon(guild_id=None):
+    """Spawns a random pokemon based on weighted rarity (using the guild's spawn table)."""
+    table = spawn_tables.get(GUILD_SPAWN_TABLES.get(guild_id, "default"))
+    if table is None:
         return None
-
-    return random.choices(pokemon_pool, weights=weights, k=1)[0]
+    return table.sample()
 
 def get_moves_for_level(pokemon_name, level):
     """Returns moves a pokemon should know at a given level."""
@@ -228,8 +390,7 @@ async def evolve_pokemon(pokemon):
     old_name = pokemon["name"]
     pokemon["name"] = new_form
 
-    # Recalculate stats
-    pokemon["stats"] = calculate_actual_stats(new_form, pokemon["level"], pokemon["ivs"])
+    # Stats follow the new species automatically; heal to the new max HP
     pokemon["current_hp"] = pokemon["stats"]["HP"]
 
     # Update moves pool (keep existing moves but allow learning new ones)
@@ -239,7 +400,7 @@ async def evolve_pokemon(pokemon):
 
 async def spawn_pokemon_in_channel(channel):
     """Spawns a wild pokemon in the channel."""
-    pokemon_name = spawn_random_pokemon()
+    pokemon_name = spawn_random_pokemon(str(channel.guild.id))
 
     if not pokemon_name:
         return
@@ -255,8 +416,10 @@ async def spawn_pokemon_in_channel(channel):
         "attempts": 0,
         "failed_catchers": set()
     }
+    expiry_wheel.schedule(("spawn", channel_id), SPAWN_DESPAWN_SECONDS, asyncio.get_event_loop().time(),
+                          (channel, spawned_pokemon[channel_id]))
 
-    poke_image = pokedex_data.get(pokemon_name, {}).get('image_url', '')
+    poke_image = pokemon_image_url(pokemon_name)
     poke_types = pokemon_data.get(pokemon_name, {}).get('types', ['Unknown'])
     types_str = "/".join(poke_types)
 
@@ -296,53 +459,153 @@ pokemon_data = {}
 moves_data = {}
 user_balance = {}
 active_battles = {} # Key: channel.id, Value: Battle object
-
-# --- Helper Functions ---
+battle_players = {} # Key: player id, Value: their running Battle (routes DM moves in O(1))
+
+# Per-species type tables, rebuilt by build_type_tables() whenever pokemon_data loads
+species_type_ids = {}  # Key: pokemon name, Value: frozenset of type ids (for STAB)
+species_defense = {}   # Key: pokemon name, Value: tuple of multipliers indexed by attacking type id
+batch_type_tables = None  # (species_ids, stab, defense) NumPy tables for calculate_damage_batch
+game_bundle = None # GameBundle with the static game data, loaded once by load_game_data()
+trainer_store = None # TrainerStore, opened once by load_trainer_data()
+team_index = TeamIndex(lambda pokemon_name: tuple(pokemon_data.get(pokemon_name, {}).get("types", ["Normal"])))
+dm_inbox = None # SharedInbox for battle moves DMed to another worker (sharded mode only)
+battle_sprites = SpriteCache(SPRITE_CACHE_DIR, atlas=SpriteAtlas.load(SPRITE_ATLAS_FILE, SPRITE_ATLAS_INDEX_FILE))
+
+# --- Data Loading ---
+# Each phase runs once per process. on_ready fires again after gateway reconnects, and
+# reloading then would reparse the game data and throw away unsaved trainer changes.
+#   1. Game data: species, moves and the tables built from them (Pokédex text stays packed until !dex)
+#   2. Trainer data: open storage, import legacy saves, replay the journal, migrate old formats
+#   3. Background tasks: saving, XP, timers, the DM inbox
 def load_data():
-    """Loads all necessary data from JSON files into memory."""
-    global user_data, pokemon_data, moves_data, user_balance
-
-    if not os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, "w") as f:
-            json.dump({}, f)
-    with open(USER_DATA_FILE, "r") as f:
-        # Handle potential empty file error
-        try:
-            user_data = json.load(f)
-        except json.JSONDecodeError:
-            user_data = {}
+    """Loads the game data and trainer data. Safe to call again; loaded phases are skipped."""
+    load_game_data()
+    load_trainer_data()
 
-    with open(POKEMON_DATA_FILE, "r") as f:
-        pokemon_data = json.load(f)
 
-    with open(MOVES_DATA_FILE, "r") as f:
-        moves_data = json.load(f)
+def load_game_data():
+    """Loads the static Pokémon and move data and builds the lookup tables (once)."""
+    global pokemon_data, moves_data, game_bundle
 
-    if not os.path.exists(USER_BALANCE_FILE):
-        with open(USER_BALANCE_FILE, "w") as f:
-            json.dump({}, f)
-    with open(USER_BALANCE_FILE, "r") as f:
+    if game_bundle is not None:
+        return
+
+    # One memory-mapped bundle instead of three JSON parses; recompiled if the JSON changed
+    bundle = ensure_bundle(GAME_DATA_BUNDLE_FILE, (POKEMON_DATA_FILE, MOVES_DATA_FILE, POKEDEX_DATA_FILE))
+    pokemon_data = bundle.pokemon_data
+    moves_data = bundle.moves_data
+
+    build_type_tables()
+    build_spawn_tables()
+    build_stat_tables()
+    game_bundle = bundle
+
+
+def load_trainer_data():
+    """Opens trainer storage and restores the last save plus anything journaled after it (once)."""
+    global user_data, user_balance, trainer_store, dm_inbox
+
+    if trainer_store is not None:
+        return  # Memory is ahead of disk by now; reopening would drop unsaved changes
+
+    journal = Journal(JOURNAL_FILE, fsync_interval=JOURNAL_FSYNC_INTERVAL)
+    if STORAGE_BACKEND == "sqlite":
+        store = TrainerStore(SqliteBackend(TRAINER_DB_FILE), journal=journal, shared=SHARDED)
+    else:
+        store = TrainerStore(JsonShardBackend(TRAINER_DATA_DIR), journal=journal)
+    if SHARDED:
+        dm_inbox = SharedInbox(TRAINER_DB_FILE)
+
+    # First run on the per-trainer layout: import the old single-file saves once
+    if store.backend.is_empty() and os.path.exists(USER_DATA_FILE):
         try:
-            user_balance = json.load(f)
-        except json.JSONDecodeError:
-            user_balance = {}
+            imported = store.import_legacy_files(USER_DATA_FILE, USER_BALANCE_FILE)
+            print(f"Imported {imported} trainers from {USER_DATA_FILE} into {STORAGE_BACKEND} storage")
+        except (ValueError, KeyError) as e:
+            print(f"✗ Couldn't import {USER_DATA_FILE}, nothing was imported (will retry next start): {e}")
+
+    user_data, user_balance = store.open()
+
+    # Redo anything that happened after the last save but before a crash
+    replayed = store.replay_journal(user_data, user_balance)
+    if replayed:
+        print(f"Replayed {replayed} journaled changes on top of the last save")
+
+    # !team summaries follow every recorded catch, level-up and evolution
+    store.listeners.append(team_index.apply)
+    trainer_store = store
+    migrate_user_data_format()
+
+
+def start_background_tasks():
+    """Starts every periodic task that isn't already running."""
+    background_tasks = [save_user_data, apply_pending_xp, expire_timers]
+    if dm_inbox is not None:
+        background_tasks.append(deliver_inbox_moves)
+    for task in background_tasks:
+        if not task.is_running():
+            task.start()
+
+
+def pokemon_image_url(pokemon_name):
+    """Official artwork URL for a species ("" if unknown). Doesn't decode the Pokédex entry."""
+    return game_bundle.image_url(pokemon_name)
+
+
+def get_pokedex_entry(pokemon_name):
+    """Full Pokédex entry, or None. Entries are read from the game-data bundle on demand."""
+    return game_bundle.pokedex_data.get(pokemon_name)
+
+
+def get_move_info(move_name: str):
+    """Looks up a move by display name ("Vine Whip") or key ("vine-whip")."""
+    move_info = game_bundle.move_lookup.get(move_name)
+    if move_info is None and move_name:
+        move_info = moves_data.get(move_key(move_name))  # Other spellings ("vine whip")
+    return move_info
+
+
+def build_type_tables():
+    """Precomputes each species' type ids and defensive multiplier vector."""
+    global species_type_ids, species_defense, batch_type_tables
+
+    species_type_ids = {}
+    species_defense = {}
+    for pokemon_name, data in pokemon_data.items():
+        type_ids = [TYPE_INDEX[t.lower()] for t in data.get("types", []) if t.lower() in TYPE_INDEX]
+        species_type_ids[pokemon_name] = frozenset(type_ids)
+        species_defense[pokemon_name] = defense_vector(type_ids or [TYPE_INDEX["normal"]])
+    batch_type_tables = build_batch_type_tables() if np is not None else None
+
+
+def defense_vector(type_ids):
+    """Multiplier of every attacking type against a defender with the given type ids."""
+    vector = []
+    for attacking_row in TYPE_MATRIX:
+        multiplier = 1.0
+        for type_id in type_ids:
+            multiplier *= attacking_row[type_id]
+        vector.append(multiplier)
+    return tuple(vector)
+
+
+# Unknown species defend as pure Normal, matching the old lookup's default
+NORMAL_DEFENSE = defense_vector([TYPE_INDEX["normal"]])
 
 
 def generate_ivs():
     """Generates a dictionary of random IVs for a Pokémon."""
     return {stat: random.randint(0, 31) for stat in ["hp", "attack", "defense", "sp_atk", "sp_def", "speed"]}
 
+def build_stat_tables():
+    """Registers every species' base stats for the memoized stat table."""
+    for pokemon_name, data in pokemon_data.items():
+        set_base_stats(pokemon_name, data["base_stats"])
+    derived_stats.cache_clear()
+
 def calculate_actual_stats(pokemon_name: str, level: int, ivs: dict):
-    """Calculates the display stats of a Pokémon."""
-    base = pokemon_data[pokemon_name]["base_stats"]
-    return {
-        "HP": ((2 * base["hp"] + ivs["hp"]) * level) // 100 + level + 10,
-        "Attack": ((2 * base["attack"] + ivs["attack"]) * level) // 100 + 5,
-        "Defense": ((2 * base["defense"] + ivs["defense"]) * level) // 100 + 5,
-        "Sp. Atk": ((2 * base["sp_atk"] + ivs["sp_atk"]) * level) // 100 + 5,
-        "Sp. Def": ((2 * base["sp_def"] + ivs["sp_def"]) * level) // 100 + 5,
-        "Speed": ((2 * base["speed"] + ivs["speed"]) * level) // 100 + 5,
-    }
+    """Calculates the display stats of a Pokémon (memoized; owned Pokémon derive them the same way)."""
+    return derived_stats(SPECIES.id_of(pokemon_name), level, IVs(ivs).values())
 
 
 def calculate_damage(attacker_pokemon: dict, defender_pokemon: dict, move_name: str):
@@ -350,7 +613,7 @@ def calculate_damage(attacker_pokemon: dict, defender_pokemon: dict, move_name:
     Calculates damage using the actual Pokémon damage formula.
     Returns: (damage, type_effectiveness, is_critical, messages_list)
     """
-    move_info = moves_data.get(move_name.lower())
+    move_info = get_move_info(move_name)
     if not move_info:
         return 0, 1.0, False, ["Move not found!"]
 
@@ -380,18 +643,16 @@ def calculate_damage(attacker_pokemon: dict, defender_pokemon: dict, move_name:
     is_critical = random.random() < 0.0625
     critical_multiplier = 1.5 if is_critical else 1.0
 
-    # STAB (Same Type Attack Bonus) - 1.5x if move type matches Pokémon type
-    attacker_types = pokemon_data.get(attacker_pokemon["name"], {}).get("types", [])
-    stab = 1.5 if move_type in [t.lower() for t in attacker_types] else 1.0
+    move_type_id = TYPE_INDEX.get(move_type)
 
-    # Type effectiveness
-    defender_types = pokemon_data.get(defender_pokemon["name"], {}).get("types", ["normal"])
-    type_effectiveness = 1.0
+    # STAB (Same Type Attack Bonus) - 1.5x if move type matches Pokémon type
+    stab = 1.5 if move_type_id in species_type_ids.get(attacker_pokemon["name"], ()) else 1.0
 
-    for def_type in defender_types:
-        def_type_lower = def_type.lower()
-        if move_type in TYPE_CHART and def_type_lower in TYPE_CHART[move_type]:
-            type_effectiveness *= TYPE_CHART[move_type][def_type_lower]
+    # Type effectiveness - a single lookup in the defender's precomputed vector
+    if move_type_id is None:
+        type_effectiveness = 1.0
+    else:
+        type_effectiveness = species_defense.get(defender_pokemon["name"], NORMAL_DEFENSE)[move_type_id]
 
     # Random factor (0.85 to 1.0)
     random_factor = random.uniform(0.85, 1.0)
@@ -420,29 +681,117 @@ def calculate_damage(attacker_pokemon: dict, defender_pokemon: dict, move_name:
 
     return final_damage, type_effectiveness, is_critical, messages
 
+def build_batch_type_tables():
+    """
+    NumPy versions of the per-species type tables for calculate_damage_batch.
+    Row len(species) is the "unknown species" row and column len(TYPE_NAMES) is
+    the "unknown move type" column, so lookups never need special cases.
+    """
+    species_names = list(pokemon_data)
+    species_ids = {name: i for i, name in enumerate(species_names)}
+
+    stab = np.zeros((len(species_names) + 1, len(TYPE_NAMES) + 1), dtype=bool)
+    defense = np.ones((len(species_names) + 1, len(TYPE_NAMES) + 1))
+    for name, i in species_ids.items():
+        for type_id in species_type_ids[name]:
+            stab[i, type_id] = True
+        defense[i, :len(TYPE_NAMES)] = species_defense[name]
+    defense[len(species_names), :len(TYPE_NAMES)] = NORMAL_DEFENSE
+
+    return species_ids, stab, defense
+
+
+def calculate_damage_batch(attackers, defenders, move_names, seed=None):
+    """
+    Vectorized calculate_damage for simulations and balance analysis.
+    `attackers` and `defenders` are equal-length sequences of Pokémon dicts (name, level
+    and stats from calculate_actual_stats); `move_names` holds one move per row.
+    Uses a seeded RNG for the 0.85-1.0 roll and the 6.25% crit.
+    Returns: (damage, type_effectiveness, is_critical) NumPy arrays
+    """
+    if np is None:
+        raise RuntimeError("calculate_damage_batch requires numpy (pip install numpy)")
+
+    count = len(move_names)
+    if not (len(attackers) == len(defenders) == count):
+        raise ValueError("attackers, defenders and move_names must have the same length")
+
+    species_ids, stab_table, defense_table = batch_type_tables
+    unknown_species = len(species_ids)
+    unknown_type = len(TYPE_NAMES)
+
+    # Resolve each distinct move once: (power, type id, is special)
+    move_rows = {}
+    for move_name in set(move_names):
+        move_info = get_move_info(move_name)
+        category = move_info.get("category", "physical").lower() if move_info else "status"
+        if category == "status":
+            move_rows[move_name] = (0, unknown_type, False)
+        else:
+            move_type_id = TYPE_INDEX.get(move_info.get("type", "Normal").lower(), unknown_type)
+            move_rows[move_name] = (move_info.get("power", 0), move_type_id, category == "special")
+
+    # Gather the per-row inputs into flat arrays
+    rows = [move_rows[move_name] for move_name in move_names]
+    power = np.array([row[0] for row in rows], dtype=float)
+    move_type_ids = np.array([row[1] for row in rows], dtype=np.int64)
+    special = np.array([row[2] for row in rows], dtype=bool)
+
+    level = np.array([a["level"] for a in attackers], dtype=float)
+    attack_stat = np.array([a["stats"]["Sp. Atk"] if s else a["stats"]["Attack"] for a, s in zip(attackers, special)], dtype=float)
+    defense_stat = np.array([d["stats"]["Sp. Def"] if s else d["stats"]["Defense"] for d, s in zip(defenders, special)], dtype=float)
+    attacker_ids = np.array([species_ids.get(a["name"], unknown_species) for a in attackers], dtype=np.int64)
+    defender_ids = np.array([species_ids.get(d["name"], unknown_species) for d in defenders], dtype=np.int64)
+
+    rng = np.random.default_rng(seed)
+    is_critical = rng.random(count) < 0.0625
+    random_factor = rng.uniform(0.85, 1.0, count)
+
+    stab = np.where(stab_table[attacker_ids, move_type_ids], 1.5, 1.0)
+    type_effectiveness = defense_table[defender_ids, move_type_ids]
+
+    base_damage = (((2 * level / 5) + 2) * power * attack_stat / defense_stat) / 50 + 2
+    final_damage = base_damage * np.where(is_critical, 1.5, 1.0) * stab * type_effectiveness * random_factor
+    damage = np.maximum(1, final_damage.astype(np.int64))
+
+    # Status moves, unknown moves and immunities deal no damage
+    no_damage = power == 0
+    damage[no_damage | (type_effectiveness == 0)] = 0
+    type_effectiveness[no_damage] = 1.0
+    is_critical[no_damage] = False
+
+    return damage, type_effectiveness, is_critical
+
+
 def create_pokemon(pokemon_name: str, level: int = 5):
-    """Creates a new Pokémon dictionary object."""
+    """Creates a new Pokémon record."""
     ivs = generate_ivs()
     stats = calculate_actual_stats(pokemon_name, level, ivs)
-    return {
-        "name": pokemon_name,
-        "level": level,
-        "xp": 0,
-        "gender": random.choice(["Male", "Female"]),
-        "nature": random.choice(["Adamant", "Bold", "Brave", "Calm", "Gentle", "Hardy", "Jolly", "Modest", "Quiet", "Timid"]),
-        "ivs": ivs,
-        "stats": stats,
-        "current_hp": stats["HP"],
-        "moves": pokemon_data[pokemon_name]["moves"][:4] # Take up to 4 moves
-    }
+    return Pokemon(
+        name=pokemon_name,
+        level=level,
+        xp=0,
+        gender=random.choice(["Male", "Female"]),
+        nature=random.choice(["Adamant", "Bold", "Brave", "Calm", "Gentle", "Hardy", "Jolly", "Modest", "Quiet", "Timid"]),
+        ivs=ivs,
+        current_hp=stats["HP"],
+        moves=pokemon_data[pokemon_name]["moves"][:4] # Take up to 4 moves
+    )
 
 def migrate_user_data_format():
     """
     One-time migration script.
     Converts old user data format (flat structure) to the new team-based format.
     """
+    if trainer_store.backend.lazy:
+        # Lazy storage starts with nothing cached: ask it for the trainers without a team
+        candidates = [user_id for user_id, _, _ in trainer_store.backend.iter_records(teamless=True)]
+    else:
+        candidates = list(user_data) # Use list to allow modification during iteration
+
     data_migrated = False
-    for user_id, player_data in list(user_data.items()): # Use list to allow modification during iteration
+    for user_id in candidates:
+        player_data = user_data[user_id]
         # Check for the old format key "starter" at the top level
         if "starter" in player_data and "pokemons" not in player_data:
             print(f"Migrating data for user {user_id}...")
@@ -460,17 +809,16 @@ def migrate_user_data_format():
             # Recalculate stats to ensure they are correct and consistent
             stats = calculate_actual_stats(starter_name, level, ivs)
 
-            migrated_pokemon = {
-                "name": starter_name,
-                "level": level,
-                "xp": player_data.get("xp", 0),
-                "gender": player_data.get("gender", random.choice(["Male", "Female"])),
-                "nature": player_data.get("nature", random.choice(["Adamant", "Bold", "Brave"])),
-                "ivs": ivs,
-                "stats": stats,
-                "current_hp": stats["HP"], # Set current HP to max HP
-                "moves": pokemon_data.get(starter_name, {}).get("moves", [])[:4]
-            }
+            migrated_pokemon = Pokemon(
+                name=starter_name,
+                level=level,
+                xp=player_data.get("xp", 0),
+                gender=player_data.get("gender", random.choice(["Male", "Female"])),
+                nature=player_data.get("nature", random.choice(["Adamant", "Bold", "Brave"])),
+                ivs=ivs,
+                current_hp=stats["HP"], # Set current HP to max HP
+                moves=pokemon_data.get(starter_name, {}).get("moves", [])[:4]
+            )
 
             # Create the new user data structure
             user_data[user_id] = {
@@ -478,11 +826,11 @@ def migrate_user_data_format():
                 "selected_pokemon_index": 0,
                 "items": {} # Add items field for future use
             }
+            trainer_store.record("trainer", user_id, trainer=user_data[user_id])
 
     if data_migrated:
         print("Data migration complete. Saving new format to disk.")
-        with open(USER_DATA_FILE, "w") as f:
-            json.dump(user_data, f, indent=4)
+        trainer_store.flush(user_data, user_balance)
 
 # --- Battle System Class ---
 # ============================================
@@ -505,17 +853,24 @@ class Battle:
         self.challenger_move = None
         self.opponent_move = None
         self.move_selection_active = False
+        self.moves_ready = asyncio.Event()  # Set once both moves are in (or the battle ends)
 
         # Get selected Pokémon from user data and CREATE COPIES for the battle
         challenger_data = user_data[str(challenger.id)]
-        self.challenger_pokemon = dict(challenger_data["pokemons"][challenger_data["selected_pokemon_index"]])
-        if self.challenger_pokemon["current_hp"] <= 0:
-            self.challenger_pokemon["current_hp"] = self.challenger_pokemon["stats"]["HP"]
+        self.challenger_pokemon = challenger_data["pokemons"][challenger_data["selected_pokemon_index"]].copy()
 
         opponent_data = user_data[str(opponent.id)]
-        self.opponent_pokemon = dict(opponent_data["pokemons"][opponent_data["selected_pokemon_index"]])
-        if self.opponent_pokemon["current_hp"] <= 0:
-            self.opponent_pokemon["current_hp"] = self.opponent_pokemon["stats"]["HP"]
+        self.opponent_pokemon = opponent_data["pokemons"][opponent_data["selected_pokemon_index"]].copy()
+
+        # All battle rules live in the I/O-free engine; this class only talks to Discord
+        self.state = BattleState(self.challenger_pokemon, self.opponent_pokemon, calculate_damage, get_move_info)
+        self.players = {CHALLENGER: challenger, OPPONENT: opponent}
+
+        # Key: move id, Value: the move as the Pokémon knows it, for checking DM choices
+        self.known_moves = {
+            CHALLENGER: {MOVES.get(m): m for m in self.challenger_pokemon["moves"]},
+            OPPONENT: {MOVES.get(m): m for m in self.opponent_pokemon["moves"]},
+        }
 
     def get_hp_bar(self, current_hp: int, max_hp: int, length: int = 20) -> str:
         """Creates a visual HP bar."""
@@ -541,54 +896,23 @@ class Battle:
         """
         Creates a single image with both Pokémon side by side.
         Returns a discord.File object or None if failed.
+        Sprites and finished scenes are cached, so only the first turn does any image work.
         """
         try:
-            cp_image_url = pokedex_data.get(self.challenger_pokemon['name'], {}).get('image_url')
-            op_image_url = pokedex_data.get(self.opponent_pokemon['name'], {}).get('image_url')
+            cp_name = self.challenger_pokemon['name']
+            op_name = self.opponent_pokemon['name']
+            cp_image_url = pokemon_image_url(cp_name)
+            op_image_url = pokemon_image_url(op_name)
 
             if not cp_image_url or not op_image_url:
                 return None
 
-            # Download both images
-            print(f"Downloading images for battle...")
-            response1 = requests.get(cp_image_url, timeout=5)
-            response2 = requests.get(op_image_url, timeout=5)
-
-            # Open images
-            img1 = Image.open(BytesIO(response1.content)).convert('RGBA')
-            img2 = Image.open(BytesIO(response2.content)).convert('RGBA')
-
-            # Resize both to same height (300px)
-            target_height = 300
-
-            # Resize image 1
-            ratio1 = target_height / img1.height
-            new_width1 = int(img1.width * ratio1)
-            img1_resized = img1.resize((new_width1, target_height), Image.Resampling.LANCZOS)
-
-            # Resize image 2
-            ratio2 = target_height / img2.height
-            new_width2 = int(img2.width * ratio2)
-            img2_resized = img2.resize((new_width2, target_height), Image.Resampling.LANCZOS)
-
-            # Create combined image with space between
-            gap = 100  # Space between Pokémon
-            total_width = new_width1 + gap + new_width2
-
-            # Create transparent background
-            combined = Image.new('RGBA', (total_width, target_height), (0, 0, 0, 0))
-
-            # Paste images side by side
-            combined.paste(img1_resized, (0, 0), img1_resized)
-            combined.paste(img2_resized, (new_width1 + gap, 0), img2_resized)
-
-            # Save to bytes
-            output = BytesIO()
-            combined.save(output, format='PNG')
-            output.seek(0)
-
-            print(f"✓ Combined battle image created successfully!")
-            return discord.File(output, filename='battle_scene.png')
+            scene = await battle_sprites.get_battle_scene(
+                cp_name, cp_image_url, op_name, op_image_url, budget=BATTLE_IMAGE_BUDGET_SECONDS
+            )
+            if scene is None:
+                return None
+            return discord.File(BytesIO(scene), filename='battle_scene.png')
 
         except Exception as e:
             print(f"✗ Error creating battle image: {e}")
@@ -635,7 +959,7 @@ class Battle:
         )
         embed.add_field(name=f"🔴 {self.opponent.display_name}", value=opponent_info, inline=True)
 
-        embed.set_footer(text="⏱️ You have 10 seconds to choose your move in DMs!")
+        embed.set_footer(text=f"⏱️ You have {MOVE_SELECTION_SECONDS} seconds to choose your move in DMs!")
 
         # Create combined side-by-side image
         battle_image = await self.create_side_by_side_image()
@@ -646,8 +970,8 @@ class Battle:
             await self.channel.send(embed=embed, file=battle_image)
         else:
             # Fallback: use separate images
-            cp_image = pokedex_data.get(cp['name'], {}).get('image_url')
-            op_image = pokedex_data.get(op['name'], {}).get('image_url')
+            cp_image = pokemon_image_url(cp['name'])
+            op_image = pokemon_image_url(op['name'])
 
             if cp_image:
                 embed.set_image(url=cp_image)
@@ -669,7 +993,7 @@ class Battle:
             embed.add_field(name="Available Moves", value=moves_list, inline=False)
             embed.add_field(
                 name="How to choose:",
-                value=f"Reply here in DM with: `!fight <move name>`\n**You have 10 seconds!**",
+                value=f"Reply here in DM with: `!fight <move name>`\n**You have {MOVE_SELECTION_SECONDS} seconds!**",
                 inline=False
             )
 
@@ -686,8 +1010,20 @@ class Battle:
             await self.channel.send(f"⚠️ Error sending DM to {player.mention}: {e}")
             return False
 
+    async def run(self):
+        """Plays turns until someone wins, forfeits or the DMs fail. Iterative, so long battles don't grow the stack."""
+        while not self.game_over:
+            if not await self.request_moves():
+                return
+            await self.execute_turn()
+            if not self.game_over:
+                await asyncio.sleep(1.5)
+
     async def request_moves(self):
-        """Requests moves from both players via DM."""
+        """
+        Requests moves from both players via DM and waits until both have chosen or the
+        deadline passes. Returns False if the battle ended instead.
+        """
         if self.game_over:
             return False
 
@@ -696,9 +1032,7 @@ class Battle:
         self.move_selection_active = True
         self.challenger_move = None
         self.opponent_move = None
-
-        
-
+        self.moves_ready.clear()
 
         # Send move options to both players
         await self.show_battle_status("📨 Sending move selections to your DMs...")
@@ -711,27 +1045,31 @@ class Battle:
         if not dm_sent_challenger or not dm_sent_opponent:
             await self.channel.send("❌ Battle cancelled due to DM issues. Make sure your DMs are open!")
             self.game_over = True
-            if self.channel.id in active_battles:
-                del active_battles[self.channel.id]
+            remove_battle(self)
             return False
 
         await self.channel.send("✅ Move selections sent! Check your DMs!")
 
-        # Wait 10 seconds for both players to choose
-        print("Waiting 10 seconds for move selection...")
-        await asyncio.sleep(10)
+        # Wait for both players to choose, at most MOVE_SELECTION_SECONDS
+        print(f"Waiting up to {MOVE_SELECTION_SECONDS} seconds for move selection...")
+        try:
+            await asyncio.wait_for(self.moves_ready.wait(), timeout=MOVE_SELECTION_SECONDS)
+        except asyncio.TimeoutError:
+            pass
 
+        self.move_selection_active = False
         if self.game_over:
             return False
 
-        self.move_selection_active = False
-
         print(f"Challenger move: {self.challenger_move}, Opponent move: {self.opponent_move}")
-
-        # Process the turn
-        await self.execute_turn()
         return True
 
+    def stop(self):
+        """Ends the battle from outside (forfeit) and wakes a turn that is waiting for moves."""
+        self.game_over = True
+        self.move_selection_active = False
+        self.moves_ready.set()
+
     async def process_move_from_dm(self, player: discord.Member, move_name: str):
         """Processes a move selection from DM."""
         if self.game_over:
@@ -744,18 +1082,24 @@ class Battle:
 
         if player == self.challenger:
             if self.challenger_move is None:
-                if move_name.lower() in [m.lower() for m in self.challenger_pokemon["moves"]]:
-                    self.challenger_move = move_name
-                    await player.send(f"✅ You selected **{move_name.capitalize()}**!")
+                known = self.known_moves[CHALLENGER].get(MOVES.get(move_name))
+                if known:
+                    self.challenger_move = known
+                    if self.opponent_move is not None:
+                        self.moves_ready.set()
+                    await player.send(f"✅ You selected **{known}**!")
                     return True
                 else:
                     await player.send(f"❌ Your {self.challenger_pokemon['name'].capitalize()} doesn't know that move!")
                     return False
         elif player == self.opponent:
             if self.opponent_move is None:
-                if move_name.lower() in [m.lower() for m in self.opponent_pokemon["moves"]]:
-                    self.opponent_move = move_name
-                    await player.send(f"✅ You selected **{move_name.capitalize()}**!")
+                known = self.known_moves[OPPONENT].get(MOVES.get(move_name))
+                if known:
+                    self.opponent_move = known
+                    if self.challenger_move is not None:
+                        self.moves_ready.set()
+                    await player.send(f"✅ You selected **{known}**!")
                     return True
                 else:
                     await player.send(f"❌ Your {self.opponent_pokemon['name'].capitalize()} doesn't know that move!")
@@ -763,7 +1107,7 @@ class Battle:
         return False
 
     async def execute_turn(self):
-        """Executes the turn after both players have selected moves."""
+        """Executes the turn after both players have selected moves (or ran out of time)."""
         if self.game_over:
             return
 
@@ -774,88 +1118,39 @@ class Battle:
         if self.opponent_move is None:
             await self.channel.send(f"⏱️ {self.opponent.mention} didn't select a move in time!")
 
-        # If neither selected, end turn
+        # If neither selected, end turn; run() requests moves again
         if self.challenger_move is None and self.opponent_move is None:
             await self.channel.send("💤 Both players passed! Requesting moves again...")
-            await self.request_moves()
             return
 
-        # Determine order based on speed (faster goes first)
-        challenger_speed = self.challenger_pokemon['stats']['Speed']
-        opponent_speed = self.opponent_pokemon['stats']['Speed']
-
-        # Create attack order
-        if challenger_speed > opponent_speed:
-            first_attacker = self.challenger
-            first_move = self.challenger_move
-            second_attacker = self.opponent
-            second_move = self.opponent_move
-        elif opponent_speed > challenger_speed:
-            first_attacker = self.opponent
-            first_move = self.opponent_move
-            second_attacker = self.challenger
-            second_move = self.challenger_move
-        else:
-            # Same speed - random
-            if random.choice([True, False]):
-                first_attacker = self.challenger
-                first_move = self.challenger_move
-                second_attacker = self.opponent
-                second_move = self.opponent_move
-            else:
-                first_attacker = self.opponent
-                first_move = self.opponent_move
-                second_attacker = self.challenger
-                second_move = self.challenger_move
-
-        # Execute first attack
-        if first_move:
-            fainted = await self.execute_attack(first_attacker, first_move)
-            if fainted or self.game_over:
-                return
+        self.state.turns += 1
 
-        await asyncio.sleep(1)
-
-        # Execute second attack
-        if second_move:
-            fainted = await self.execute_attack(second_attacker, second_move)
-            if fainted or self.game_over:
-                return
+        # Faster Pokémon goes first (ties are random)
+        order = self.state.turn_order(self.challenger_move, self.opponent_move)
 
-        # If battle still going, request next moves
-        if not self.game_over:
-            await asyncio.sleep(1.5)
-            await self.request_moves()
+        for i, (side, move_name) in enumerate(order):
+            if i > 0:
+                await asyncio.sleep(1)
+            if move_name:
+                fainted = await self.execute_attack(self.players[side], move_name)
+                if fainted or self.game_over:
+                    return
 
     async def execute_attack(self, attacker: discord.Member, move_name: str):
         """Executes a single attack and returns True if defender fainted."""
+        side = CHALLENGER if attacker == self.challenger else OPPONENT
+        defender = self.players[1 - side]
+        attacker_pokemon = self.state.pokemon[side]
+        defender_pokemon = self.state.pokemon[1 - side]
 
-        # Determine attacker and defender
-        if attacker == self.challenger:
-            attacker_pokemon = self.challenger_pokemon
-            defender_pokemon = self.opponent_pokemon
-            defender = self.opponent
-        else:
-            attacker_pokemon = self.opponent_pokemon
-            defender_pokemon = self.challenger_pokemon
-            defender = self.challenger
-
-        # Normalize move name for lookup
-        move_lookup_name = move_name.lower().replace(" ", "-")
-        move_info = moves_data.get(move_lookup_name)
-
-        if not move_info:
+        result = self.state.attack(side, move_name)
+        if result.move_info is None:
             await self.channel.send(f"❌ Move '{move_name}' not found!")
             return False
 
-        # Calculate damage
-        damage, type_eff, is_crit, effect_messages = calculate_damage(
-            attacker_pokemon, defender_pokemon, move_name
-        )
-
         # Get move details
-        move_type = move_info.get("type", "Normal")
-        move_category = move_info.get("category", "Physical").capitalize()
+        move_type = result.move_info.get("type", "Normal")
+        move_category = result.move_info.get("category", "Physical").capitalize()
         category_emoji = "⚔️" if move_category.lower() == "physical" else "✨" if move_category.lower() == "special" else "🛡️"
 
         # Create attack embed
@@ -866,18 +1161,15 @@ class Battle:
             inline=False
         )
 
-        # Apply damage
-        defender_pokemon["current_hp"] = max(0, defender_pokemon["current_hp"] - damage)
-
         # Add damage info
-        if damage > 0:
-            damage_text = f"💥 **{damage} damage** to {defender.display_name}'s {defender_pokemon['name'].capitalize()}!"
-            if effect_messages:
-                damage_text += "\n" + "\n".join(effect_messages)
+        if result.damage > 0:
+            damage_text = f"💥 **{result.damage} damage** to {defender.display_name}'s {defender_pokemon['name'].capitalize()}!"
+            if result.messages:
+                damage_text += "\n" + "\n".join(result.messages)
             embed.add_field(name="Result", value=damage_text, inline=False)
         else:
-            if effect_messages:
-                embed.add_field(name="Result", value="\n".join(effect_messages), inline=False)
+            if result.messages:
+                embed.add_field(name="Result", value="\n".join(result.messages), inline=False)
 
         # Show HP bars
         embed.add_field(
@@ -889,8 +1181,7 @@ class Battle:
         await self.channel.send(embed=embed)
 
         # Check if defender fainted
-        if defender_pokemon["current_hp"] <= 0:
-            defender_pokemon["current_hp"] = 0
+        if result.fainted:
             self.game_over = True
             await asyncio.sleep(1)
             await self.channel.send(f"💀 {defender.display_name}'s {defender_pokemon['name'].capitalize()} fainted!")
@@ -908,7 +1199,7 @@ class Battle:
         )
 
         winner_pokemon = self.challenger_pokemon if winner == self.challenger else self.opponent_pokemon
-        embed.set_thumbnail(url=pokedex_data.get(winner_pokemon['name'], {}).get('image_url', ''))
+        embed.set_thumbnail(url=pokemon_image_url(winner_pokemon['name']))
         embed.add_field(
             name="Victory!",
             value=f"{winner_pokemon['name'].capitalize()} (Lv.{winner_pokemon['level']}) is victorious!",
@@ -918,18 +1209,30 @@ class Battle:
         await self.channel.send(embed=embed)
 
         # Clean up
-        if self.channel.id in active_battles:
-            del active_battles[self.channel.id]
+        remove_battle(self)
+
 
+def add_battle(battle: Battle):
+    """Registers a started battle under its channel and both players."""
+    active_battles[battle.channel.id] = battle
+    battle_players[battle.challenger.id] = battle
+    battle_players[battle.opponent.id] = battle
 
+def remove_battle(battle: Battle):
+    """Unregisters a battle; safe to call more than once."""
+    if active_battles.get(battle.channel.id) is battle:
+        del active_battles[battle.channel.id]
+    for player in (battle.challenger, battle.opponent):
+        if battle_players.get(player.id) is battle:
+            del battle_players[player.id]
 
 
 # --- Bot Events ---
 @bot.event
 async def on_ready():
+    # Also fires after reconnects; every phase only does its work the first time
     load_data()
-    migrate_user_data_format() # <-- MIGRATION SCRIPT RUNS HERE
-    save_user_data.start()
+    start_background_tasks()
     print(f"Logged in as {bot.user}")
 
 @bot.event
@@ -942,40 +1245,35 @@ async def on_message(message):
 
     # Handle DM messages for battle move selection
     if isinstance(message.channel, discord.DMChannel):
-        for channel_id, battle in active_battles.items():
-            if isinstance(battle, Battle):
-                if message.author in [battle.challenger, battle.opponent]:
-                    if message.content.startswith("!fight "):
-                        move_name = message.content[7:].strip()
-                        await battle.process_move_from_dm(message.author, move_name)
-                    return
-
-    # Skip spawn system for DMs
-    if isinstance(message.channel, discord.DMChannel):
+        if message.content.startswith("!fight "):
+            move_name = message.content[7:].strip()
+            battle = battle_players.get(message.author.id)
+            if battle is not None:
+                await battle.process_move_from_dm(message.author, move_name)
+            elif dm_inbox is not None:
+                # Not a battle in this worker; the worker running it picks the move up from the inbox
+                await asyncio.to_thread(dm_inbox.put, str(message.author.id), move_name)
+        # No spawn system in DMs
         return
 
     guild_id = str(message.guild.id)
     channel_id = str(message.channel.id)
     user_id = str(message.author.id)
 
-    # Track active users
+    # Track active users (entries older than 5 minutes expire lazily)
     current_time = asyncio.get_event_loop().time()
-    if guild_id not in active_users:
-        active_users[guild_id] = {}
-    active_users[guild_id][user_id] = current_time
-
-    # Clean up old active users (older than 5 minutes)
-    cutoff_time = current_time - 300
-    active_users[guild_id] = {uid: time for uid, time in active_users[guild_id].items() if time > cutoff_time}
+    active_users.touch(guild_id, user_id, current_time)
 
     # Initialize spawn tracker for this channel
     if channel_id not in spawn_tracker:
-        spawn_tracker[channel_id] = {"messages": 0, "last_spawn": 0}
+        spawn_tracker[channel_id] = {"messages": 0, "last_spawn": 0, "last_message": current_time}
+        expiry_wheel.schedule(("tracker", channel_id), SPAWN_TRACKER_IDLE_SECONDS, current_time)
 
     spawn_tracker[channel_id]["messages"] += 1
+    spawn_tracker[channel_id]["last_message"] = current_time
 
     # Determine spawn threshold based on server activity
-    active_user_count = len(active_users.get(guild_id, {}))
+    active_user_count = active_users.active_count(guild_id, current_time)
     threshold = SPAWN_ACTIVE_MESSAGES if active_user_count >= SPAWN_ACTIVE_THRESHOLD else SPAWN_BASE_MESSAGES
 
     # Check if we should spawn
@@ -986,40 +1284,13 @@ async def on_message(message):
             spawn_tracker[channel_id]["messages"] = 0
             spawn_tracker[channel_id]["last_spawn"] = current_time
 
-    # XP gain system for selected pokemon
-    if user_id in user_data and user_data[user_id].get("pokemons"):
-        player_data = user_data[user_id]
-        if 0 <= player_data["selected_pokemon_index"] < len(player_data["pokemons"]):
-            selected_pokemon = player_data["pokemons"][player_data["selected_pokemon_index"]]
-
-            selected_pokemon["xp"] += 5
-            if selected_pokemon["xp"] >= 100:
-                selected_pokemon["xp"] -= 100
-                selected_pokemon["level"] += 1
-
-                # Recalculate stats
-                selected_pokemon["stats"] = calculate_actual_stats(
-                    selected_pokemon["name"], 
-                    selected_pokemon["level"], 
-                    selected_pokemon["ivs"]
-                )
-                selected_pokemon["current_hp"] = selected_pokemon["stats"]["HP"]
-
-                await message.channel.send(
-                    f"🎉 Congrats {message.author.mention}! Your {selected_pokemon['name'].capitalize()} is now **Level {selected_pokemon['level']}**!"
-                )
-
-
-                # Check for evolution
-                can_evo, new_form = can_evolve(selected_pokemon)
-                if can_evo:
-                    old_name = selected_pokemon['name']
-                    evolved, _ = await evolve_pokemon(selected_pokemon)
-                    if evolved:
-                        await message.channel.send(
-                            f"✨ What? {old_name.capitalize()} is evolving!\n"
-                            f"🎊 Your {old_name.capitalize()} evolved into **{selected_pokemon['name'].capitalize()}**!"
-                        )
+    # XP gain system: only count here, apply_pending_xp() levels up in batches
+    if user_id in user_data:
+        pending = pending_xp.get(user_id)
+        if pending is None:
+            pending = pending_xp[user_id] = {"xp": 0, "channel": message.channel, "member": message.author}
+        pending["xp"] += XP_PER_MESSAGE
+        pending["channel"] = message.channel  # Announce where they last chatted
 
 @bot.command()
 async def catch(ctx):
@@ -1055,6 +1326,7 @@ async def catch(ctx):
         return
 
     user_balance[user_id]["pokeballs"][required_ball] -= 1
+    trainer_store.record("spend", user_id, item=required_ball, count=user_balance[user_id]["pokeballs"][required_ball])
 
     catch_rate = get_catch_rate(rarity)
     roll = random.randint(1, 100)
@@ -1064,19 +1336,19 @@ async def catch(ctx):
         stats = calculate_actual_stats(pokemon_name, level, ivs)
         moves = get_moves_for_level(pokemon_name, level)
 
-        new_pokemon = {
-            "name": pokemon_name,
-            "level": level,
-            "xp": 0,
-            "gender": random.choice(["Male", "Female"]),
-            "nature": random.choice(["Adamant", "Bold", "Brave", "Calm", "Gentle", "Hardy", "Jolly", "Modest", "Quiet", "Timid"]),
-            "ivs": ivs,
-            "stats": stats,
-            "current_hp": stats["HP"],
-            "moves": moves[:4]
-        }
+        new_pokemon = Pokemon(
+            name=pokemon_name,
+            level=level,
+            xp=0,
+            gender=random.choice(["Male", "Female"]),
+            nature=random.choice(["Adamant", "Bold", "Brave", "Calm", "Gentle", "Hardy", "Jolly", "Modest", "Quiet", "Timid"]),
+            ivs=ivs,
+            current_hp=stats["HP"],
+            moves=moves[:4]
+        )
 
         user_data[user_id]["pokemons"].append(new_pokemon)
+        trainer_store.record("catch", user_id, slot=len(user_data[user_id]["pokemons"]) - 1, pokemon=new_pokemon)
 
         iv_percent = sum(ivs.values()) / (31 * 6) * 100
 
@@ -1086,7 +1358,7 @@ async def catch(ctx):
             color=0xFFD700
         )
 
-        poke_image = pokedex_data.get(pokemon_name, {}).get('image_url')
+        poke_image = pokemon_image_url(pokemon_name)
         if poke_image:
             embed.set_thumbnail(url=poke_image)
 
@@ -1097,6 +1369,7 @@ async def catch(ctx):
         await ctx.send(embed=embed)
 
         del spawned_pokemon[channel_id]
+        expiry_wheel.cancel(("spawn", channel_id))
 
     else:
         spawn_data["attempts"] += 1
@@ -1105,6 +1378,7 @@ async def catch(ctx):
         if spawn_data["attempts"] >= MAX_CATCH_ATTEMPTS:
             await ctx.send(f"💨 The wild {pokemon_name.capitalize()} ran away after {MAX_CATCH_ATTEMPTS} failed attempts!")
             del spawned_pokemon[channel_id]
+            expiry_wheel.cancel(("spawn", channel_id))
         else:
             attempts_left = MAX_CATCH_ATTEMPTS - spawn_data["attempts"]
             await ctx.send(f"❌ {ctx.author.mention} failed to catch it! **{attempts_left}** attempts remaining for others.")
@@ -1135,13 +1409,17 @@ async def evolve(ctx):
     evolved, _ = await evolve_pokemon(selected_pokemon)
 
     if evolved:
+        trainer_store.record(
+            "evolve", user_id, slot=player_data["selected_pokemon_index"],
+            fields={key: selected_pokemon[key] for key in ("name", "current_hp")}
+        )
         embed = discord.Embed(
             title="✨ Evolution!",
             description=f"Your **{old_name.capitalize()}** evolved into **{selected_pokemon['name'].capitalize()}**!",
             color=0xFFD700
         )
 
-        poke_image = pokedex_data.get(selected_pokemon['name'], {}).get('image_url')
+        poke_image = pokemon_image_url(selected_pokemon['name'])
         if poke_image:
             embed.set_image(url=poke_image)
 
@@ -1161,11 +1439,12 @@ async def learn(ctx, *, move_name: str = None):
     player_data = user_data[user_id]
     selected_pokemon = player_data["pokemons"][player_data["selected_pokemon_index"]]
 
-    all_moves = pokemon_data.get(selected_pokemon["name"], {}).get("moves", [])
+    learnable = game_bundle.learnset(selected_pokemon["name"])  # Move IDs, in learnset order
     current_moves = selected_pokemon.get("moves", [])
+    current_ids = {MOVES.get(m) for m in current_moves}
 
     if not move_name:
-        available = [m for m in all_moves if m.lower() not in [cm.lower() for cm in current_moves]]
+        available = [MOVES.names[m] for m in learnable if m not in current_ids]
 
         embed = discord.Embed(
             title=f"📚 Moves for {selected_pokemon['name'].capitalize()}",
@@ -1195,16 +1474,18 @@ async def learn(ctx, *, move_name: str = None):
         await ctx.send(embed=embed)
         return
 
-    move_name_normalized = move_name.lower().replace(" ", "-")
+    learn_id = MOVES.get(move_name)
 
-    if move_name_normalized not in [m.lower().replace(" ", "-") for m in all_moves]:
+    if not game_bundle.can_learn(selected_pokemon["name"], learn_id):
         await ctx.send(f"❌ {selected_pokemon['name'].capitalize()} cannot learn {move_name.title()}!")
         return
 
-    if move_name_normalized in [m.lower().replace(" ", "-") for m in current_moves]:
+    if learn_id in current_ids:
         await ctx.send(f"❌ {selected_pokemon['name'].capitalize()} already knows {move_name.title()}!")
         return
 
+    move_name = MOVES.names[learn_id]  # Store the canonical name, not what was typed
+
     if len(current_moves) >= 4:
         moves_list = "\n".join([f"{i+1}. **{m.title()}**" for i, m in enumerate(current_moves)])
         await ctx.send(
@@ -1230,6 +1511,8 @@ async def learn(ctx, *, move_name: str = None):
 
             old_move = current_moves[slot]
             current_moves[slot] = move_name
+            selected_pokemon["moves"] = current_moves  # The record hands out copies of its move list
+            trainer_store.record("learn", user_id, slot=player_data["selected_pokemon_index"], fields={"moves": current_moves})
 
             await ctx.send(f"✅ {selected_pokemon['name'].capitalize()} forgot **{old_move.title()}** and learned **{move_name.title()}**!")
 
@@ -1238,6 +1521,8 @@ async def learn(ctx, *, move_name: str = None):
             return
     else:
         current_moves.append(move_name)
+        selected_pokemon["moves"] = current_moves
+        trainer_store.record("learn", user_id, slot=player_data["selected_pokemon_index"], fields={"moves": current_moves})
         await ctx.send(f"✅ {selected_pokemon['name'].capitalize()} learned **{move_name.title()}**!")
 
 @bot.command()
@@ -1250,7 +1535,7 @@ async def forcespawn(ctx, pokemon_name: str = None, level: int = None):
             await ctx.send(f"❌ Pokemon '{pokemon_name}' not found!")
             return
     else:
-        pokemon_name = spawn_random_pokemon()
+        pokemon_name = spawn_random_pokemon(str(ctx.guild.id))
 
     if not level:
         level = random.randint(1, 30)
@@ -1270,6 +1555,25 @@ async def forcespawn(ctx, pokemon_name: str = None, level: int = None):
     await spawn_pokemon_in_channel(ctx.channel)
 
 
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def savestats(ctx):
+    """Shows how long trainer saves block the bot (admin only)."""
+    saves = trainer_store.saves
+    avg_ms = trainer_store.total_block_ms / saves if saves else 0.0
+    last_write_ms = trainer_store.writer.last_write_ms if trainer_store.writer else 0.0
+
+    embed = discord.Embed(title="💾 Save Stats", color=0x00AAFF)
+    embed.add_field(name="Saves", value=str(saves), inline=True)
+    embed.add_field(name="Pending Changes", value=str(len(trainer_store.dirty)), inline=True)
+    embed.add_field(name="Loop Blocked (last)", value=f"{trainer_store.last_block_ms:.2f} ms", inline=True)
+    embed.add_field(name="Loop Blocked (avg)", value=f"{avg_ms:.2f} ms", inline=True)
+    embed.add_field(name="Loop Blocked (max)", value=f"{trainer_store.max_block_ms:.2f} ms", inline=True)
+    embed.add_field(name="Disk Write (last)", value=f"{last_write_ms:.2f} ms", inline=True)
+
+    await ctx.send(embed=embed)
+
+
 @bot.command()
 async def spawnrate(ctx):
     """Shows spawn information for current channel."""
@@ -1281,7 +1585,7 @@ async def spawnrate(ctx):
 
     messages = spawn_tracker[channel_id]["messages"]
     guild_id = str(ctx.guild.id)
-    active_count = len(active_users.get(guild_id, {}))
+    active_count = active_users.active_count(guild_id, asyncio.get_event_loop().time())
     threshold = SPAWN_ACTIVE_MESSAGES if active_count >= SPAWN_ACTIVE_THRESHOLD else SPAWN_BASE_MESSAGES
 
     embed = discord.Embed(title="📊 Spawn Info", color=0x00AAFF)
@@ -1296,11 +1600,143 @@ async def spawnrate(ctx):
 # --- Looping Tasks ---
 @tasks.loop(seconds=SAVE_INTERVAL_SECONDS)
 async def save_user_data():
-    with open(USER_DATA_FILE, "w") as f:
-        json.dump(user_data, f, indent=4)
+    # Only trainers touched since the last save are written; idle minutes cost nothing.
+    # The actual disk write happens on the store's writer thread, and the journal
+    # entries it covers are dropped once it lands (compaction).
+    saved = trainer_store.flush(user_data, user_balance)
+    if saved and trainer_store.last_block_ms > 50:
+        print(f"⚠️ Saving {saved} trainers blocked the event loop for {trainer_store.last_block_ms:.1f} ms")
+    if SHARDED:
+        # Other workers write to the same store; forget idle trainers so they're re-read
+        trainer_store.evict_idle(SHARED_CACHE_IDLE_SECONDS)
+    team_index.evict_idle(TEAM_INDEX_IDLE_SECONDS)
+
+@tasks.loop(seconds=EXPIRY_TICK_SECONDS)
+async def expire_timers():
+    """Despawns uncaught Pokémon, cancels stale challenges and forgets idle channels."""
+    now = asyncio.get_event_loop().time()
+    for (kind, channel_id), payload in expiry_wheel.advance(now):
+        try:
+            if kind == "spawn":
+                channel, spawn_data = payload
+                # A catch or a newer spawn may have replaced it already
+                if spawned_pokemon.get(channel_id) is spawn_data:
+                    del spawned_pokemon[channel_id]
+                    await channel.send(f"💨 The wild {spawn_data['name'].capitalize()} ran away!")
+
+            elif kind == "challenge":
+                channel, pending_battle = payload
+                if active_battles.get(channel_id) is pending_battle:
+                    del active_battles[channel_id]
+                    await channel.send(
+                        f"⌛ {pending_battle['opponent'].mention} didn't accept "
+                        f"{pending_battle['challenger'].mention}'s challenge in time. Battle cancelled."
+                    )
+
+            elif kind == "tracker":
+                tracker = spawn_tracker.get(channel_id)
+                if tracker is None:
+                    continue
+                idle_for = now - tracker["last_message"]
+                if idle_for >= SPAWN_TRACKER_IDLE_SECONDS:
+                    del spawn_tracker[channel_id]
+                else:
+                    # Still in use: check again when it could next become idle
+                    expiry_wheel.schedule(("tracker", channel_id), SPAWN_TRACKER_IDLE_SECONDS - idle_for, now)
+        except discord.HTTPException as e:
+            print(f"✗ Error announcing expired {kind} in channel {channel_id}: {e}")
+
+@tasks.loop(seconds=DM_INBOX_POLL_SECONDS)
+async def deliver_inbox_moves():
+    """Sharded mode: runs battle moves that were DMed to the worker owning shard 0."""
+    if not battle_players:
+        return
+
+    players = {str(player_id): battle for player_id, battle in battle_players.items()}
+    for user_id, move_name in await asyncio.to_thread(dm_inbox.take, players):
+        battle = players[user_id]
+        player = battle.challenger if str(battle.challenger.id) == user_id else battle.opponent
+        await battle.process_move_from_dm(player, move_name)
+
+async def grant_xp(user_id: str, amount: int):
+    """
+    Adds XP to a trainer's selected Pokémon, handling any number of level-ups and
+    evolutions at once. Returns an announcement string, or None if nothing happened.
+    """
+    player_data = user_data.get(user_id)
+    if not player_data or not player_data.get("pokemons"):
+        return None
+    slot = player_data["selected_pokemon_index"]
+    if not 0 <= slot < len(player_data["pokemons"]):
+        return None
+
+    pokemon = player_data["pokemons"][slot]
+    pokemon["xp"] += amount
+    levels_gained, pokemon["xp"] = divmod(pokemon["xp"], XP_PER_LEVEL)
+    if not levels_gained:
+        trainer_store.record("xp", user_id, slot=slot, fields={"xp": pokemon["xp"]})
+        return None
+
+    pokemon["level"] += levels_gained
+    pokemon["current_hp"] = pokemon["stats"]["HP"]  # Stats are derived from the new level
+    trainer_store.record(
+        "level_up", user_id, slot=slot,
+        fields={key: pokemon[key] for key in ("level", "xp", "current_hp")}
+    )
+    lines = [f"Your {pokemon['name'].capitalize()} is now **Level {pokemon['level']}**!"]
+
+    # A big jump can pass more than one evolution level
+    first_form = pokemon["name"]
+    while can_evolve(pokemon)[0]:
+        await evolve_pokemon(pokemon)
+    if pokemon["name"] != first_form:
+        trainer_store.record(
+            "evolve", user_id, slot=slot,
+            fields={key: pokemon[key] for key in ("name", "current_hp")}
+        )
+        lines.append(
+            f"✨ What? {first_form.capitalize()} is evolving!\n"
+            f"🎊 Your {first_form.capitalize()} evolved into **{pokemon['name'].capitalize()}**!"
+        )
+
+    return "\n".join(lines)
+
+
+@tasks.loop(seconds=XP_FLUSH_INTERVAL_SECONDS)
+async def apply_pending_xp():
+    # Swap the batch out first so messages arriving during the sends start a new one
+    global pending_xp
+    batch, pending_xp = pending_xp, {}
+
+    for user_id, pending in batch.items():
+        announcement = await grant_xp(user_id, pending["xp"])
+        if not announcement:
+            continue
+        try:
+            await pending["channel"].send(f"🎉 Congrats {pending['member'].mention}! {announcement}")
+        except discord.HTTPException as e:
+            print(f"✗ Could not announce level-up for {user_id}: {e}")
+
+
+async def drain_pending_xp():
+    """Applies XP still waiting for the next batch, without announcements. Used at shutdown."""
+    global pending_xp
+    batch, pending_xp = pending_xp, {}
+    for user_id, pending in batch.items():
+        await grant_xp(user_id, pending["xp"])
 
-    with open(USER_BALANCE_FILE, "w") as f:
-        json.dump(user_balance, f, indent=4)
+
+_close_bot = bot.close
+
+async def close_bot():
+    """Stops the XP batcher and applies what it was holding, so the final flush includes it."""
+    apply_pending_xp.cancel()
+    if trainer_store is not None:
+        await drain_pending_xp()
+    await battle_sprites.close()
+    await _close_bot()
+
+bot.close = close_bot
 
 # --- Player Commands ---
 @bot.command()
@@ -1311,6 +1747,7 @@ async def start(ctx):
     else:
         user_data[user_id] = {}
         init_user_balance(user_id)  # Initialize balance
+        trainer_store.record("trainer", user_id, trainer=user_data[user_id])
         await ctx.send(
             "Welcome to the world of Pokémon! Please choose your starter by typing `!choose <pokemon>`\n"
             "(Options: bulbasaur, charmander, squirtle)"
@@ -1343,6 +1780,8 @@ async def choose(ctx, choice: str):
     if user_id in user_balance:
         user_balance[user_id]["pokecoins"] += 1000  # Bonus coins
         user_balance[user_id]["pokeballs"]["pokeball"] += 10  # Bonus Poké Balls
+        trainer_store.record("balance", user_id, balance=user_balance[user_id])
+    trainer_store.record("trainer", user_id, trainer=user_data[user_id])
 
     await ctx.send(
         f"You chose **{choice.capitalize()}**! Your journey begins now!\n"
@@ -1385,6 +1824,7 @@ def init_user_balance(user_id: str):
                 "masterball": 0      # Master Balls (rare!)
             }
         }
+        trainer_store.record("balance", user_id, balance=user_balance[user_id])
 
 # ============================================
 # REPLACE YOUR !bal COMMAND WITH THIS
@@ -1534,7 +1974,7 @@ async def info(ctx, index: int = None):
     )
 
     # Add Pokémon image
-    poke_image = pokedex_data.get(poke['name'], {}).get('image_url')
+    poke_image = pokemon_image_url(poke['name'])
     if poke_image:
         embed.set_thumbnail(url=poke_image)
 
@@ -1622,10 +2062,10 @@ async def info(ctx, index: int = None):
 # -----------------------------------------------------------------
 
 @bot.command()
-async def team(ctx):
+async def team(ctx, *options: str):
     """
-    Shows a user's Pokémon collection in a clean, 3-column embed.
-    (No 6-poke limit, no thumbnail)
+    Shows a user's Pokémon collection in a clean, 3-column embed, one page at a time.
+    Usage: !team [page] [level|iv|name] [species]  (e.g. !team 2 iv, !team pidgey level)
     """
     user_id = str(ctx.author.id)
 
@@ -1636,15 +2076,41 @@ async def team(ctx):
     player_data = user_data[user_id]
     all_pokemon = player_data["pokemons"]  # This is their full collection
 
+    # Options can come in any order: a number is the page, a sort name sorts, anything else filters
+    page = 1
+    sort = "slot"
+    species = None
+    for option in options:
+        option = option.lower()
+        if option.isdigit():
+            page = max(1, int(option))
+        elif option in TEAM_SORTS:
+            sort = option
+        else:
+            species = option
+
+    if species is not None and species not in pokemon_data:
+        await ctx.send(f"❌ '{species}' isn't a Pokémon! Usage: `!team [page] [level|iv|name] [species]`")
+        return
+
+    # Rows (IV%, types, level) come precomputed from the summary index
+    rows, total = team_index.page(user_id, all_pokemon, page, TEAM_PAGE_SIZE, sort, species)
+    page_count = max(1, -(-total // TEAM_PAGE_SIZE))
+    if not rows and total:
+        await ctx.send(f"❌ There are only {page_count} page(s)!")
+        return
+    if not rows:
+        await ctx.send(f"❌ You don't have any {species.capitalize()}!")
+        return
+
     # Create embed
     embed = discord.Embed(
-        title=f"🎒 {ctx.author.display_name}'s Pokémon Collection", # Changed title
+        title=f"🎒 {ctx.author.display_name}'s Pokémon Collection",
         color=0x3BA55D  # Green
     )
 
-    # --- CHANGE 2: Removed '/ 6' limit ---
     embed.set_author(
-        name=f"Total Pokémon: {len(all_pokemon)}", # Changed from "Team Size: ... / 6"
+        name=f"Total Pokémon: {len(all_pokemon)}",
         icon_url=ctx.author.display_avatar.url
     )
 
@@ -1661,39 +2127,24 @@ async def team(ctx):
     type_col = ""
     info_col = ""
 
-    # --- NEW: Limit to 25 to avoid embed breaking ---
-    display_limit = 25 
-    pokemon_to_display = all_pokemon[:display_limit]
-
-    for i, poke in enumerate(pokemon_to_display):
-        # Calculate IV
-        iv_percent = sum(poke["ivs"].values()) / (31 * 6) * 100
-
-        # Get types (supports dual-type)
-        poke_types = pokemon_data.get(poke['name'], {}).get('types', ['Normal'])
-
-        # Build type emoji display
-        if len(poke_types) == 1:
-            type_display = type_emojis.get(poke_types[0], "⚪")
-        else:
-            type1_emoji = type_emojis.get(poke_types[0], "⚪")
-            type2_emoji = type_emojis.get(poke_types[1], "⚪")
-            type_display = f"{type1_emoji}/{type2_emoji}"
+    for row in rows:
+        # Build type emoji display (supports dual-type)
+        type_display = "/".join(type_emojis.get(poke_type, "⚪") for poke_type in row.types[:2])
 
         # Gender
-        gender = "♂️" if poke['gender'] == "Male" else "♀️"
+        gender = "♂️" if row.gender == "Male" else "♀️"
 
         # Selected marker
-        selected_mark = "▶️ " if i == player_data["selected_pokemon_index"] else ""
+        selected_mark = "▶️ " if row.slot == player_data["selected_pokemon_index"] else ""
 
-        # 1. Pokémon Column
-        pokemon_col += f"**{i+1}.** {selected_mark}**{poke['name'].capitalize()}** {gender}\n"
+        # 1. Pokémon Column (numbers are the collection slots, so !select and !info still match)
+        pokemon_col += f"**{row.slot + 1}.** {selected_mark}**{row.name.capitalize()}** {gender}\n"
 
         # 2. Type Column
         type_col += f"{type_display}\n"
 
         # 3. Info Column
-        info_col += f"Lvl. **{poke['level']}** | IV: **{iv_percent:.1f}%**\n"
+        info_col += f"Lvl. **{row.level}** | IV: **{row.iv_percent:.1f}%**\n"
 
     # --- Add the three columns as inline fields ---
     # \u200b is a zero-width space to prevent empty field errors if list is empty
@@ -1711,15 +2162,16 @@ async def team(ctx):
     footer_text = f"✨ Active: {selected_name} • Lvl {selected_level} • HP: {selected_hp}/{max_hp}\n" \
                   f"Use !select <number> to switch • !info <number> for details"
 
-    # Add note if we are only showing a part of the collection
-    if len(all_pokemon) > display_limit:
-        footer_text += f"\n\nDisplaying {display_limit} of {len(all_pokemon)} Pokémon. (Page 1)"
+    # Page info, and how to get to the rest of the collection
+    shown = f"{total} {species.capitalize()}" if species else f"{total} Pokémon"
+    footer_text += f"\n\nPage {page}/{page_count} • {shown}"
+    if sort != "slot":
+        footer_text += f" • sorted by {sort}"
+    if page_count > 1:
+        footer_text += "\n!team <page> [level|iv|name] [species]"
 
     embed.set_footer(text=footer_text)
 
-    # --- CHANGE 1: Removed thumbnail ---
-    # The embed.set_thumbnail() lines have been deleted.
-
     await ctx.send(embed=embed)
 
 
@@ -1733,6 +2185,7 @@ async def select(ctx, position: int):
     player_data = user_data[user_id]
     if 1 <= position <= len(player_data["pokemons"]):
         player_data["selected_pokemon_index"] = position - 1
+        trainer_store.record("select", user_id, index=position - 1)
         selected_poke_name = player_data['pokemons'][position - 1]['name'].capitalize()
         await ctx.send(f"You have selected your **{selected_poke_name}**!")
     else:
@@ -1760,12 +2213,19 @@ async def battle(ctx, opponent: discord.Member):
         await ctx.send(f"❌ {opponent.mention} has not started their journey yet!")
         return
 
+    for player in (challenger, opponent):
+        if player.id in battle_players:
+            await ctx.send(f"❌ {player.mention} is already in a battle!")
+            return
+
     # Create pending battle
     active_battles[ctx.channel.id] = {
         "type": "pending",
         "challenger": challenger,
         "opponent": opponent
     }
+    expiry_wheel.schedule(("challenge", ctx.channel.id), CHALLENGE_TIMEOUT_SECONDS,
+                          asyncio.get_event_loop().time(), (ctx.channel, active_battles[ctx.channel.id]))
 
     embed = discord.Embed(
         title="⚔️ Battle Challenge!",
@@ -1797,9 +2257,16 @@ async def accept(ctx):
     challenger = pending_battle["challenger"]
     opponent = pending_battle["opponent"]
 
+    # Either player may have started another battle since the challenge
+    for player in (challenger, opponent):
+        if player.id in battle_players:
+            await ctx.send(f"❌ {player.mention} is already in a battle!")
+            return
+
     # Create battle instance
+    expiry_wheel.cancel(("challenge", ctx.channel.id))
     battle_instance = Battle(challenger, opponent, ctx.channel)
-    active_battles[ctx.channel.id] = battle_instance
+    add_battle(battle_instance)
 
     # Start the battle
     await ctx.send("🔥 **Battle Starting!** 🔥")
@@ -1807,8 +2274,8 @@ async def accept(ctx):
     await battle_instance.show_battle_status("The battle begins!")
     await asyncio.sleep(1)
 
-    # Request first moves
-    await battle_instance.request_moves()
+    # Play turns until the battle ends
+    await battle_instance.run()
 
 
 # ============================================
@@ -1823,208 +2290,6 @@ async def accept(ctx):
 #     # This is now handled in DMs
 
 
-# ============================================
-# FIX 1: UPDATED show_battle_status METHOD
-# Find this method in your Battle class and REPLACE it completely
-# ============================================
-
-async def show_battle_status(self, message: str = ""):
-    """Sends an embed with the current battle status to the channel."""
-    embed = discord.Embed(
-        title=f"⚔️ Battle: {self.challenger.display_name} vs {self.opponent.display_name}",
-        description=message if message else "Choose your move!",
-        color=discord.Color.blue()
-    )
-
-    # Challenger's Pokémon info
-    cp = self.challenger_pokemon
-    cp_name = cp['name'].capitalize()
-    cp_types = " | ".join(pokemon_data.get(cp['name'], {}).get('types', ['Normal']))
-
-    embed.add_field(
-        name=f"{self.challenger.display_name}'s {cp_name} (Lv.{cp['level']})",
-        value=f"**Type:** {cp_types}\n{self.get_hp_bar(cp['current_hp'], cp['stats']['HP'])}",
-        inline=False
-    )
-
-    # Opponent's Pokémon info
-    op = self.opponent_pokemon
-    op_name = op['name'].capitalize()
-    op_types = " | ".join(pokemon_data.get(op['name'], {}).get('types', ['Normal']))
-
-    embed.add_field(
-        name=f"{self.opponent.display_name}'s {op_name} (Lv.{op['level']})",
-        value=f"**Type:** {op_types}\n{self.get_hp_bar(op['current_hp'], op['stats']['HP'])}",
-        inline=False
-    )
-
-    # Add challenger's Pokémon image (thumbnail - top right)
-    cp_image = pokedex_data.get(cp['name'], {}).get('image_url')
-    if cp_image:
-        embed.set_thumbnail(url=cp_image)
-
-    # Add opponent's Pokémon image (main image - bottom)
-    op_image = pokedex_data.get(op['name'], {}).get('image_url')
-    if op_image:
-        embed.set_image(url=op_image)
-
-    embed.set_footer(text="Moves sent to DMs! You have 15 seconds to choose.")
-    await self.channel.send(embed=embed)
-
-
-# ============================================
-# FIX 2: ADD game_over CHECK IN request_moves
-# Find your request_moves method and UPDATE the beginning
-# ============================================
-
-async def request_moves(self):
-    """Requests moves from both players via DM."""
-    # Check if battle is already over (important for forfeit fix)
-    if self.game_over:
-        return False
-
-    self.move_selection_active = True
-    self.challenger_move = None
-    self.opponent_move = None
-
-    # Send move options to both players
-    await self.show_battle_status("📨 Move selections sent to your DMs!")
-
-    dm_sent_challenger = await self.send_move_choices_dm(self.challenger, self.challenger_pokemon)
-    dm_sent_opponent = await self.send_move_choices_dm(self.opponent, self.opponent_pokemon)
-
-    if not dm_sent_challenger or not dm_sent_opponent:
-        await self.channel.send("❌ Battle cancelled due to DM issues.")
-        if self.channel.id in active_battles:
-            del active_battles[self.channel.id]
-        return False
-
-    # Wait 15 seconds for both players to choose
-    await asyncio.sleep(15)
-
-    # Check again if battle ended during the wait
-    if self.game_over:
-        return False
-
-    self.move_selection_active = False
-
-    # Process the turn
-    await self.execute_turn()
-    return True
-
-
-# ============================================
-# FIX 3: ADD game_over CHECK IN execute_turn
-# Find your execute_turn method and UPDATE it
-# ============================================
-
-async def execute_turn(self):
-    """Executes the turn after both players have selected moves."""
-
-    # Check if battle is already over
-    if self.game_over:
-        return
-
-    # Check if both players selected moves
-    if self.challenger_move is None:
-        await self.channel.send(f"⏱️ {self.challenger.mention} didn't select a move in time!")
-
-    if self.opponent_move is None:
-        await self.channel.send(f"⏱️ {self.opponent.mention} didn't select a move in time!")
-
-    # If neither selected, end turn
-    if self.challenger_move is None and self.opponent_move is None:
-        await self.channel.send("💤 Both players passed! Requesting moves again...")
-        await self.request_moves()
-        return
-
-    # Determine order based on speed (faster goes first)
-    challenger_speed = self.challenger_pokemon['stats']['Speed']
-    opponent_speed = self.opponent_pokemon['stats']['Speed']
-
-    # Create attack order
-    if challenger_speed > opponent_speed:
-        first_attacker = self.challenger
-        first_move = self.challenger_move
-        second_attacker = self.opponent
-        second_move = self.opponent_move
-    elif opponent_speed > challenger_speed:
-        first_attacker = self.opponent
-        first_move = self.opponent_move
-        second_attacker = self.challenger
-        second_move = self.challenger_move
-    else:
-        # Same speed - random
-        if random.choice([True, False]):
-            first_attacker = self.challenger
-            first_move = self.challenger_move
-            second_attacker = self.opponent
-            second_move = self.opponent_move
-        else:
-            first_attacker = self.opponent
-            first_move = self.opponent_move
-            second_attacker = self.challenger
-            second_move = self.challenger_move
-
-    # Execute first attack
-    if first_move:
-        fainted = await self.execute_attack(first_attacker, first_move)
-        if fainted or self.game_over:
-            return
-
-    await asyncio.sleep(1)
-
-    # Execute second attack
-    if second_move:
-        fainted = await self.execute_attack(second_attacker, second_move)
-        if fainted or self.game_over:
-            return
-
-    # If battle still going, request next moves
-    if not self.game_over:
-        await asyncio.sleep(1.5)
-        await self.request_moves()
-
-
-# ============================================
-# FIX 4: ADD game_over CHECK IN process_move_from_dm
-# Find your process_move_from_dm method and UPDATE it
-# ============================================
-
-async def process_move_from_dm(self, player: discord.Member, move_name: str):
-    """Processes a move selection from DM."""
-    # Don't process moves if battle is over
-    if self.game_over:
-        await player.send("❌ This battle has already ended!")
-        return False
-
-    if not self.move_selection_active:
-        await player.send("⏱️ Move selection is not currently active!")
-        return False
-
-    if player == self.challenger:
-        if self.challenger_move is None:
-            # Validate move
-            if move_name.lower() in [m.lower() for m in self.challenger_pokemon["moves"]]:
-                self.challenger_move = move_name
-                await player.send(f"✅ You selected **{move_name.capitalize()}**!")
-                return True
-            else:
-                await player.send(f"❌ Your {self.challenger_pokemon['name'].capitalize()} doesn't know that move!")
-                return False
-    elif player == self.opponent:
-        if self.opponent_move is None:
-            # Validate move
-            if move_name.lower() in [m.lower() for m in self.opponent_pokemon["moves"]]:
-                self.opponent_move = move_name
-                await player.send(f"✅ You selected **{move_name.capitalize()}**!")
-                return True
-            else:
-                await player.send(f"❌ Your {self.opponent_pokemon['name'].capitalize()} doesn't know that move!")
-                return False
-    return False
-
-
 # ============================================
 # FIX 5: COMPLETELY REPLACE YOUR !forfeit COMMAND
 # Find @bot.command() async def forfeit and REPLACE THE ENTIRE THING
@@ -2056,9 +2321,8 @@ async def forfeit(ctx):
         await ctx.send("❌ You are not part of this battle.")
         return
 
-    # IMPORTANT: Set game_over flag FIRST to stop all battle processes
-    battle_instance.game_over = True
-    battle_instance.move_selection_active = False
+    # IMPORTANT: Stop the battle FIRST so a turn waiting for moves ends right away
+    battle_instance.stop()
 
     # Send forfeit message
     embed = discord.Embed(
@@ -2074,8 +2338,7 @@ async def forfeit(ctx):
     await ctx.send(embed=embed)
 
     # Clean up the battle
-    if ctx.channel.id in active_battles:
-        del active_battles[ctx.channel.id]
+    remove_battle(battle_instance)
 
     # Notify both players in DM
     try:
@@ -2084,36 +2347,6 @@ async def forfeit(ctx):
     except:
         pass  # DMs might be closed
 
-# === ADD THIS TO YOUR CONSTANTS SECTION (around line 15) ===
-POKEDEX_DATA_FILE = "pokedex_data.json"
-
-# === ADD THIS TO YOUR GLOBAL DATA STORES (around line 23) ===
-pokedex_data = {}
-
-# === UPDATE YOUR load_data() FUNCTION (around line 27) ===
-def load_data():
-    """Loads all necessary data from JSON files into memory."""
-    global user_data, pokemon_data, moves_data, pokedex_data
-
-    if not os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, "w") as f:
-            json.dump({}, f)
-    with open(USER_DATA_FILE, "r") as f:
-        try:
-            user_data = json.load(f)
-        except json.JSONDecodeError:
-            user_data = {}
-
-    with open(POKEMON_DATA_FILE, "r") as f:
-        pokemon_data = json.load(f)
-
-    with open(MOVES_DATA_FILE, "r") as f:
-        moves_data = json.load(f)
-
-    # Load Pokédex data
-    with open(POKEDEX_DATA_FILE, "r") as f:
-        pokedex_data = json.load(f)
-
 
 # === ADD THIS COMMAND AFTER YOUR OTHER BOT COMMANDS (around line 260) ===
 
@@ -2128,12 +2361,11 @@ async def dex(ctx, *, pokemon_name: str = None):
     pokemon_name = pokemon_name.lower()
 
     # Check if Pokémon exists in Pokédex
-    if pokemon_name not in pokedex_data:
+    poke = get_pokedex_entry(pokemon_name)
+    if poke is None:
         await ctx.send(f"❌ Pokémon '{pokemon_name}' not found in the Pokédex!")
         return
 
-    poke = pokedex_data[pokemon_name]
-
     # Type color mapping
     type_colors = {
         "grass": 0x78C850,
@@ -2240,14 +2472,12 @@ async def move(ctx, *, move_name: str = None):
         await ctx.send("Please specify a move! Usage: `!move <move_name>`")
         return
 
-    move_name = move_name.lower().replace(" ", "-")  # Handle spaces
-
-    # Check if move exists
-    if move_name not in moves_data:
+    # Check if move exists ("Vine Whip", "vine whip" and "vine-whip" all work)
+    move = get_move_info(move_name)
+    if move is None:
         await ctx.send(f"❌ Move '{move_name}' not found in the database!")
         return
-
-    move = moves_data[move_name]
+    move_ref = MOVES.get(move_name)
 
     # Type color mapping
     type_colors = {
@@ -2276,7 +2506,7 @@ async def move(ctx, *, move_name: str = None):
 
     # Create embed
     embed = discord.Embed(
-        title=f"⚡ {move_name.replace('-', ' ').title()}",
+        title=f"⚡ {MOVES.names[move_ref]}",
         description=move.get("effect", "No description available."),
         color=embed_color
     )
@@ -2332,12 +2562,20 @@ async def move(ctx, *, move_name: str = None):
     # Add a spacer for better layout
     embed.add_field(name="\u200b", value="\u200b", inline=True)
 
+    # Species that learn it by leveling up
+    learned_by = game_bundle.learners(move_name)
+    if learned_by:
+        shown = ", ".join(name.capitalize() for name in learned_by[:15])
+        if len(learned_by) > 15:
+            shown += f" and {len(learned_by) - 15} more"
+        embed.add_field(name="🧬 Learned by", value=shown, inline=False)
+
     # Show which of user's Pokémon can learn this move (if user has started)
     user_id = str(ctx.author.id)
     if user_id in user_data and user_data[user_id].get("pokemons"):
         learners = []
         for poke in user_data[user_id]["pokemons"]:
-            if move_name in [m.lower().replace(" ", "-") for m in poke.get("moves", [])]:
+            if any(MOVES.get(m) == move_ref for m in poke.get("moves", [])):
                 learners.append(poke["name"].capitalize())
 
         if learners:
@@ -2359,8 +2597,7 @@ async def moves(ctx, filter_type: str = None):
 
     if filter_type:
         filter_type = filter_type.lower()
-        filtered_moves = {name: data for name, data in moves_data.items() 
-                         if data.get("type", "").lower() == filter_type}
+        filtered_moves = [MOVES.names[move] for move in game_bundle.moves_of_type(filter_type)]
 
         if not filtered_moves:
             await ctx.send(f"No moves found for type '{filter_type}'!")
@@ -2370,10 +2607,10 @@ async def moves(ctx, filter_type: str = None):
         moves_list = filtered_moves
     else:
         title = "All Available Moves"
-        moves_list = moves_data
+        moves_list = list(moves_data)
 
     # Create paginated list (show first 50)
-    move_names = sorted(list(moves_list.keys())[:50])
+    move_names = sorted(moves_list[:50])
 
     embed = discord.Embed(
         title=title,
@@ -2390,10 +2627,16 @@ async def moves(ctx, filter_type: str = None):
     
 # --- Run Bot ---
 if __name__ == "__main__":
-    keep_alive()
+    # The health-check web server binds a fixed port, so only one worker runs it
+    if OWNS_DM_SHARD:
+        keep_alive()
     TOKEN = os.getenv("TOKEN")
     if TOKEN:
         bot.run(TOKEN)
+        # Write out anything changed since the last save before exiting
+        if trainer_store is not None:
+            trainer_store.flush(user_data, user_balance)
+            trainer_store.close()
     else:
         print("Error: TOKEN not found in .env file.")
 
@@ -0,0 +1,251 @@
+import os
+import sys
+from functools import lru_cache
+
+STAT_NAMES = ("HP", "Attack", "Defense", "Sp. Atk", "Sp. Def", "Speed")
+IV_NAMES = ("hp", "attack", "defense", "sp_atk", "sp_def", "speed")
+
+
+def move_key(move_name: str):
+    """Canonical move ID: "Solar Beam", "solar beam" and "solar-beam" all give "solar-beam"."""
+    return "-".join(move_name.lower().split())
+
+
+class Registry:
+    """
+    Hands out small integer IDs for strings (species, moves) and maps them back.
+    With `canonical`, spellings that mean the same thing share one ID; `names`
+    keeps the first display name registered for it.
+    """
+
+    def __init__(self, canonical=None):
+        self.canonical = canonical
+        self.names = []
+        self.ids = {}  # Key: canonical name, Value: ID
+
+    def id_of(self, name: str):
+        """Returns the ID for `name`, registering it the first time it is seen."""
+        key = self.canonical(name) if self.canonical else name
+        name_id = self.ids.get(key)
+        if name_id is None:
+            name_id = self.ids[sys.intern(key)] = len(self.names)
+            self.names.append(sys.intern(name))
+        return name_id
+
+    def get(self, name: str):
+        """The ID for `name`, or None if it was never registered."""
+        return self.ids.get(self.canonical(name) if self.canonical else name)
+
+    def seed(self, names):
+        """Registers `names` in order, so each one's ID is its position (as in the game-data bundle)."""
+        for position, name in enumerate(names):
+            if self.id_of(name) != position:
+                raise ValueError(f"{name!r} was registered before the game data loaded")
+
+    def name_of(self, name_id: int):
+        return self.names[name_id]
+
+
+SPECIES = Registry()
+MOVES = Registry(canonical=move_key)  # "Vine Whip", "vine whip" and "vine-whip" are one move
+
+
+class StatBlock:
+    """
+    Six values in a fixed order, read like the old dicts (block["Sp. Atk"], .items()).
+    Immutable: assign a new block to the Pokémon to change it.
+    """
+
+    __slots__ = ("_values",)
+    KEYS = ()
+    INDEX = {}
+
+    def __init__(self, values):
+        if hasattr(values, "keys"):
+            values = [values[key] for key in self.KEYS]
+        self._values = tuple(values)
+
+    def __getitem__(self, key):
+        return self._values[self.INDEX[key]]
+
+    def get(self, key, default=None):
+        index = self.INDEX.get(key)
+        return default if index is None else self._values[index]
+
+    def __contains__(self, key):
+        return key in self.INDEX
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def keys(self):
+        return self.KEYS
+
+    def values(self):
+        """The six values as a tuple (hashable, so usable as a cache key)."""
+        return self._values
+
+    def items(self):
+        return zip(self.KEYS, self._values)
+
+    def to_dict(self):
+        return dict(zip(self.KEYS, self._values))
+
+    def __eq__(self, other):
+        if isinstance(other, StatBlock):
+            return self.KEYS == other.KEYS and self._values == other._values
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()})"
+
+
+class Stats(StatBlock):
+    __slots__ = ()
+    KEYS = STAT_NAMES
+    INDEX = {key: i for i, key in enumerate(STAT_NAMES)}
+
+
+class IVs(StatBlock):
+    __slots__ = ()
+    KEYS = IV_NAMES
+    INDEX = {key: i for i, key in enumerate(IV_NAMES)}
+
+
+# --- Derived stats ---
+BASE_STATS = {}  # Key: species id, Value: base stats in IV_NAMES order
+
+
+def set_base_stats(species_name: str, base_stats: dict):
+    """Registers a species' base stats (from pokemon_data.json) for derived_stats()."""
+    BASE_STATS[SPECIES.id_of(species_name)] = tuple(base_stats[key] for key in IV_NAMES)
+
+
+@lru_cache(maxsize=16384)
+def derived_stats(species: int, level: int, ivs: tuple):
+    """Actual stats for a species at a level with the given IVs. Memoized; blocks are shared."""
+    base = BASE_STATS[species]
+    values = [(2 * base[0] + ivs[0]) * level // 100 + level + 10]
+    values += [(2 * base[i] + ivs[i]) * level // 100 + 5 for i in range(1, 6)]
+    return Stats(values)
+
+
+class Pokemon:
+    """
+    Compact owned Pokémon. Species and moves are stored as registry IDs and IVs as a
+    six-value block; stats aren't stored at all but derived from species, level and
+    IVs, so they can't drift. It still reads and writes like the old dict
+    (poke["name"], poke["stats"]["HP"], poke.get("moves")) and saves to the same JSON
+    shape minus "stats".
+    `uid` identifies one owned Pokémon for good (its slot in a team doesn't), so several
+    processes' versions of a team can be merged Pokémon by Pokémon.
+    Note that poke["moves"] returns a new list; assign it back after changing it.
+    """
+
+    __slots__ = ("uid", "species", "level", "xp", "gender", "nature", "ivs", "current_hp", "move_ids")
+    FIELDS = ("uid", "name", "level", "xp", "gender", "nature", "ivs", "current_hp", "moves")  # What gets saved
+    KEYS = FIELDS + ("stats",)
+
+    def __init__(self, name: str, level: int, xp: int = 0, gender: str = "Male", nature: str = "Hardy",
+                 ivs=None, current_hp: int = 0, moves=(), uid: str = None):
+        self.uid = uid or os.urandom(6).hex()
+        self.species = SPECIES.id_of(name)
+        self.level = level
+        self.xp = xp
+        self.gender = sys.intern(gender)
+        self.nature = sys.intern(nature)
+        self.ivs = IVs(ivs or (0,) * 6)
+        self.current_hp = current_hp
+        self.move_ids = tuple(MOVES.id_of(move) for move in moves)
+
+    @property
+    def stats(self):
+        return derived_stats(self.species, self.level, self.ivs.values())
+
+    @classmethod
+    def from_dict(cls, data: dict, slot: int = None):
+        """
+        Older saves also carry "stats" (recomputed instead) and no "uid": those get one
+        from their team `slot`, so every process reading the same save agrees on it.
+        """
+        fields = {field: data[field] for field in cls.FIELDS if field in data}
+        if "uid" not in fields and slot is not None:
+            fields["uid"] = f"slot-{slot}"
+        return cls(**fields)
+
+    def to_dict(self):
+        data = {field: self[field] for field in self.FIELDS}
+        data["ivs"] = self.ivs.to_dict()
+        return data
+
+    def copy(self):
+        # Every field is immutable, so a shallow copy is a full copy
+        clone = Pokemon.__new__(Pokemon)
+        for slot in self.__slots__:
+            setattr(clone, slot, getattr(self, slot))
+        return clone
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    # --- Mapping compatibility with the old dict records ---
+    def __getitem__(self, key):
+        if key == "name":
+            return SPECIES.names[self.species]
+        if key == "moves":
+            return [MOVES.names[move] for move in self.move_ids]
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key == "name":
+            self.species = SPECIES.id_of(value)
+        elif key == "moves":
+            self.move_ids = tuple(MOVES.id_of(move) for move in value)
+        elif key == "ivs":
+            self.ivs = IVs(value)
+        elif key == "stats":
+            pass  # Derived; old journal records still carry it
+        elif key in ("gender", "nature"):
+            setattr(self, key, sys.intern(value))
+        elif key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def update(self, fields: dict):
+        for key, value in fields.items():
+            self[key] = value
+
+    def get(self, key, default=None):
+        if key not in self.KEYS:
+            return default
+        return self[key]
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def keys(self):
+        return self.KEYS
+
+    def items(self):
+        return [(key, self[key]) for key in self.KEYS]
+
+    def __repr__(self):
+        return f"Pokemon({self.to_dict()})"
+
+
+def encode_record(obj):
+    """json.dumps `default=` hook: writes Pokemon and stat blocks as their old dict shape."""
+    if isinstance(obj, (Pokemon, StatBlock)):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,120 @@
+import argparse
+import random
+import time
+
+import main
+from battle_engine import CHALLENGER, OPPONENT, BattleState, random_move_provider, strongest_move_provider
+
+
+def expected_power(attacker: dict, defender: dict, move_name: str):
+    """Rough damage estimate used by the 'strongest' provider: power x STAB x effectiveness."""
+    move_info = main.get_move_info(move_name)
+    if not move_info or move_info.get("category") == "status":
+        return 0
+    move_type_id = main.TYPE_INDEX.get(move_info.get("type", "Normal").lower())
+    if move_type_id is None:
+        return move_info.get("power", 0)
+    stab = 1.5 if move_type_id in main.species_type_ids.get(attacker["name"], ()) else 1.0
+    effectiveness = main.species_defense.get(defender["name"], main.NORMAL_DEFENSE)[move_type_id]
+    return move_info.get("power", 0) * stab * effectiveness
+
+
+def run_simulation(battles: int, level: int, max_turns: int, provider_name: str, seed=None):
+    """
+    Plays `battles` headless battles between random species and returns timing stats.
+    Phases: team creation, move choice, turn order, damage calculation, and the rest
+    of turn resolution (HP bookkeeping, faint checks).
+    """
+    rng = random.Random(seed)
+    random.seed(seed)  # create_pokemon / calculate_damage use the global RNG
+
+    timings = {"setup": 0.0, "move_choice": 0.0, "turn_order": 0.0, "damage": 0.0, "resolve": 0.0}
+
+    def timed(phase, fn):
+        """Wraps `fn` so the time spent in it is added to timings[phase]."""
+        def call(*args):
+            start = time.perf_counter()
+            result = fn(*args)
+            timings[phase] += time.perf_counter() - start
+            return result
+        return call
+
+    if provider_name == "strongest":
+        provider = strongest_move_provider(expected_power)
+    else:
+        provider = random_move_provider(rng)
+
+    species = list(main.pokemon_data)
+    total_turns = 0
+    draws = 0
+    wins = {CHALLENGER: 0, OPPONENT: 0}
+
+    started = time.perf_counter()
+    for _ in range(battles):
+        start = time.perf_counter()
+        state = BattleState(
+            main.create_pokemon(rng.choice(species), level),
+            main.create_pokemon(rng.choice(species), level),
+            timed("damage", main.calculate_damage), main.get_move_info, rng,
+        )
+        state.turn_order = timed("turn_order", state.turn_order)
+        timings["setup"] += time.perf_counter() - start
+
+        while not state.game_over and state.turns < max_turns:
+            start = time.perf_counter()
+            challenger_move = provider(state, CHALLENGER)
+            opponent_move = provider(state, OPPONENT)
+            timings["move_choice"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            state.resolve_turn(challenger_move, opponent_move)
+            timings["resolve"] += time.perf_counter() - start
+
+        total_turns += state.turns
+        if state.game_over:
+            wins[state.winner] += 1
+        else:
+            draws += 1
+    elapsed = time.perf_counter() - started
+
+    # Turn order and damage are measured inside resolve; report the remainder separately
+    timings["resolve"] -= timings["turn_order"] + timings["damage"]
+
+    return {
+        "battles": battles,
+        "elapsed": elapsed,
+        "turns": total_turns,
+        "draws": draws,
+        "wins": wins,
+        "timings": timings,
+    }
+
+
+def print_report(stats: dict):
+    battles = stats["battles"]
+    elapsed = stats["elapsed"]
+    print(f"\n✅ Simulated {battles} battles in {elapsed:.2f}s")
+    print(f"   Battles/sec:      {battles / elapsed:,.0f}")
+    print(f"   Turns/battle:     {stats['turns'] / battles:.2f}")
+    print(f"   Turns/sec:        {stats['turns'] / elapsed:,.0f}")
+    print(f"   Challenger wins:  {stats['wins'][CHALLENGER]}  Opponent wins: {stats['wins'][OPPONENT]}  "
+          f"Hit turn limit: {stats['draws']}")
+
+    print("\n📊 Per-phase timings:")
+    for phase, seconds in stats["timings"].items():
+        share = seconds / elapsed * 100 if elapsed else 0
+        per_turn_us = seconds / stats["turns"] * 1e6 if stats["turns"] else 0
+        print(f"   {phase:<12} {seconds:8.3f}s  {share:5.1f}%  {per_turn_us:8.2f} µs/turn")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless battle simulator for benchmarking the battle engine.")
+    parser.add_argument("--battles", type=int, default=5000)
+    parser.add_argument("--level", type=int, default=50)
+    parser.add_argument("--max-turns", type=int, default=100, help="Battles still going after this many turns count as draws")
+    parser.add_argument("--provider", choices=["random", "strongest"], default="random")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    main.load_game_data()
+    print_report(run_simulation(args.battles, args.level, args.max_turns, args.provider, args.seed))
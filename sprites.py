@@ -0,0 +1,255 @@
+import asyncio
+import json
+import mmap
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import aiohttp
+from PIL import Image
+
+
+class LRUCache:
+    """Small least-recently-used cache with a fixed number of entries."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# --- Image work (runs in worker processes, so these must stay top-level functions) ---
+def resize_to_height(image: Image.Image, target_height: int):
+    """Scales an image to the battle height, keeping its aspect ratio."""
+    ratio = target_height / image.height
+    new_width = int(image.width * ratio)
+    return image.resize((new_width, target_height), Image.Resampling.LANCZOS)
+
+
+def resize_sprite(raw_bytes: bytes, target_height: int):
+    """Scales a downloaded sprite to the battle height and returns it as PNG bytes."""
+    resized = resize_to_height(Image.open(BytesIO(raw_bytes)).convert('RGBA'), target_height)
+
+    output = BytesIO()
+    resized.save(output, format='PNG')
+    return output.getvalue()
+
+
+def _open_sprite(sprite):
+    """Sprites are PNG bytes (cache) or (width, height, RGBA pixels) tuples (atlas)."""
+    if isinstance(sprite, tuple):
+        width, height, pixels = sprite
+        return Image.frombuffer('RGBA', (width, height), pixels, 'raw', 'RGBA', 0, 1)
+    return Image.open(BytesIO(sprite)).convert('RGBA')
+
+
+def compose_scene(left_sprite, right_sprite, target_height: int, gap: int):
+    """Pastes two resized sprites side by side on a transparent background and returns PNG bytes."""
+    left = _open_sprite(left_sprite)
+    right = _open_sprite(right_sprite)
+
+    total_width = left.width + gap + right.width
+    combined = Image.new('RGBA', (total_width, target_height), (0, 0, 0, 0))
+    combined.paste(left, (0, 0), left)
+    combined.paste(right, (left.width + gap, 0), right)
+
+    output = BytesIO()
+    combined.save(output, format='PNG')
+    return output.getvalue()
+
+
+# --- Sprite atlas ---
+# sprite_atlas.bin holds every sprite's raw RGBA pixels back to back (already at battle
+# height); sprite_atlas.json maps each Pokémon to [offset, width, height] in that file.
+def write_sprite_atlas(sprites: dict, atlas_file: str, index_file: str, target_height: int):
+    """Packs {pokemon_name: PIL image at target_height} into an atlas file plus its index."""
+    index = {}
+    offset = 0
+    with open(atlas_file, "wb") as f:
+        for pokemon_name, image in sprites.items():
+            pixels = image.convert('RGBA').tobytes()
+            f.write(pixels)
+            index[pokemon_name] = [offset, image.width, image.height]
+            offset += len(pixels)
+
+    with open(index_file, "w", encoding="utf-8") as f:
+        json.dump({"target_height": target_height, "sprites": index}, f, separators=(",", ":"))
+
+
+class SpriteAtlas:
+    """Read-only, memory-mapped view of a sprite atlas. Slicing a sprite needs no decoding."""
+
+    def __init__(self, atlas_file: str, index_file: str):
+        with open(index_file, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.target_height = index["target_height"]
+        self.index = index["sprites"]
+
+        with open(atlas_file, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def load(cls, atlas_file: str, index_file: str):
+        """Returns the atlas, or None if it hasn't been generated."""
+        if not (os.path.exists(atlas_file) and os.path.exists(index_file)):
+            return None
+        return cls(atlas_file, index_file)
+
+    def get(self, pokemon_name: str):
+        """Returns (width, height, RGBA pixels) for a Pokémon, or None."""
+        entry = self.index.get(pokemon_name)
+        if entry is None:
+            return None
+        offset, width, height = entry
+        return width, height, self.map[offset:offset + width * height * 4]
+
+    def __contains__(self, pokemon_name):
+        return pokemon_name in self.index
+
+
+class SpriteCache:
+    """
+    Caches battle sprites so a battle only downloads and resizes them once.
+      - resized sprites: bounded LRU in memory, PNG files on disk keyed by Pokémon name
+      - finished battle scenes: PNG bytes keyed by (challenger, opponent) Pokémon
+    Downloads use one shared aiohttp session; resizing and compositing run in a
+    small process pool so concurrent battles use every core and never block the loop.
+    With a prebuilt SpriteAtlas, sprites are sliced straight out of it instead.
+    """
+
+    def __init__(self, directory: str, max_sprites: int = 64, max_scenes: int = 128,
+                 target_height: int = 300, gap: int = 100, max_workers: int = None,
+                 atlas: SpriteAtlas = None):
+        self.directory = directory
+        # An atlas built for a different height would need resizing, so it's ignored
+        self.atlas = atlas if atlas is not None and atlas.target_height == target_height else None
+        self.target_height = target_height
+        self.gap = gap  # Space between the two Pokémon
+        self.sprites = LRUCache(max_sprites)
+        self.scenes = LRUCache(max_scenes)
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.pool = None
+        self.session = None
+        self.inflight = {}  # Renders already in progress, so two turns never render the same scene twice
+        os.makedirs(directory, exist_ok=True)
+
+    def _sprite_path(self, pokemon_name: str):
+        return os.path.join(self.directory, f"{pokemon_name}.png")
+
+    def _get_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.pool
+
+    def _get_session(self):
+        # Created lazily because aiohttp sessions must be made inside the running loop
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=5),
+                connector=aiohttp.TCPConnector(limit=8),
+            )
+        return self.session
+
+    async def _download(self, image_url: str):
+        async with self._get_session().get(image_url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def _run_in_pool(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._get_pool(), func, *args)
+
+    async def get_sprite(self, pokemon_name: str, image_url: str):
+        """
+        Returns a resized sprite: from the atlas if one is loaded, otherwise as
+        PNG bytes from memory, disk or the network (in that order).
+        """
+        if self.atlas is not None and pokemon_name in self.atlas:
+            return self.atlas.get(pokemon_name)
+
+        sprite = self.sprites.get(pokemon_name)
+        if sprite is not None:
+            return sprite
+
+        path = self._sprite_path(pokemon_name)
+        if os.path.exists(path):
+            sprite = await asyncio.to_thread(_read_file, path)
+        else:
+            print(f"Downloading sprite for {pokemon_name}...")
+            raw = await self._download(image_url)
+            sprite = await self._run_in_pool(resize_sprite, raw, self.target_height)
+            await asyncio.to_thread(_write_file, path, sprite)
+
+        self.sprites.put(pokemon_name, sprite)
+        return sprite
+
+    async def _render_scene(self, key, left_name: str, left_url: str, right_name: str, right_url: str):
+        try:
+            left, right = await asyncio.gather(
+                self.get_sprite(left_name, left_url),
+                self.get_sprite(right_name, right_url),
+            )
+            scene = await self._run_in_pool(compose_scene, left, right, self.target_height, self.gap)
+            self.scenes.put(key, scene)
+            return scene
+        except Exception as e:
+            # Handled here because a render that outlived its budget has nobody awaiting it
+            print(f"✗ Error rendering battle image for {left_name} vs {right_name}: {e}")
+            return None
+        finally:
+            self.inflight.pop(key, None)
+
+    async def get_battle_scene(self, left_name: str, left_url: str, right_name: str, right_url: str,
+                               budget: float = None):
+        """
+        Returns PNG bytes of both Pokémon side by side, reusing earlier renders.
+        If `budget` seconds pass first, returns None but lets the render finish
+        in the background so the next turn gets it from the cache.
+        """
+        key = (left_name, right_name)
+        scene = self.scenes.get(key)
+        if scene is not None:
+            return scene
+
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render_scene(key, left_name, left_url, right_name, right_url))
+            self.inflight[key] = task
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=budget)
+        except asyncio.TimeoutError:
+            print(f"Battle image for {left_name} vs {right_name} is over budget, using fallback")
+            return None
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+
+def _read_file(path: str):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write_file(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
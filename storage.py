@@ -0,0 +1,1098 @@
+import argparse
+import contextlib
+import copy
+import glob
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from pokemon import Pokemon, encode_record
+
+
+def atomic_write_json(path: str, obj):
+    """Writes JSON to a temp file and renames it over `path`, so readers never see half a file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, separators=(",", ":"), ensure_ascii=False, default=encode_record)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _decode_trainer(trainer: dict):
+    """Turns the saved Pokémon dicts of a trainer into compact Pokemon records."""
+    if "pokemons" in trainer:
+        trainer["pokemons"] = [Pokemon.from_dict(poke, slot) for slot, poke in enumerate(trainer["pokemons"])]
+    return trainer
+
+
+def _plain(record):
+    """A record as the JSON it's saved as (Pokemon objects become dicts), for comparing versions."""
+    return None if record is None else json.loads(json.dumps(record, default=encode_record))
+
+
+def merge_record(base, mine, theirs, additive: bool = False):
+    """
+    Three-way merge of one saved record (plain JSON values). `base` is what this process
+    last read or wrote, `mine` what it has now, `theirs` what the database has now.
+    Whatever only one side changed is taken from that side; dicts merge key by key, lists
+    of owned Pokémon Pokémon by Pokémon (matched by "uid"), other lists item by item, and
+    items either side added are all kept. When both changed the same number and
+    `additive` is set (balances are all counters), both changes are applied; any other
+    conflict goes to `mine`.
+    """
+    if mine == base:
+        return theirs
+    if theirs == base:
+        return mine
+    if isinstance(base, dict) and isinstance(mine, dict) and isinstance(theirs, dict):
+        merged = {}
+        for key in {**theirs, **mine}:
+            if key not in mine and key in base:
+                continue  # Removed here
+            if key not in theirs and key in base and mine[key] == base[key]:
+                continue  # Removed there, unchanged here
+            merged[key] = merge_record(base.get(key), mine.get(key), theirs.get(key), additive)
+        return merged
+    if isinstance(base, list) and isinstance(mine, list) and isinstance(theirs, list):
+        keyed = [_by_uid(items) for items in (base, mine, theirs)]
+        if None not in keyed:
+            return _merge_by_uid(*keyed, additive)
+    if isinstance(base, list) and isinstance(mine, list) and isinstance(theirs, list) \
+            and len(mine) >= len(base) and len(theirs) >= len(base):
+        return ([merge_record(b, m, t, additive) for b, m, t in zip(base, mine, theirs)]
+                + theirs[len(base):] + mine[len(base):])
+    if additive and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (base, mine, theirs)):
+        return theirs + (mine - base)
+    return mine
+
+
+def _by_uid(items: list):
+    """The items keyed by "uid" if they all have one (owned Pokémon), else None."""
+    if all(isinstance(item, dict) and "uid" in item for item in items):
+        return {item["uid"]: item for item in items}
+    return None
+
+
+def _merge_by_uid(base: dict, mine: dict, theirs: dict, additive: bool):
+    """merge_record for lists keyed by _by_uid(). Keeps the stored order (theirs), then adds ours."""
+    merged = []
+    for uid in {**theirs, **base, **mine}:
+        if uid not in mine and uid in base:
+            continue  # Removed here
+        if uid not in theirs and uid in base and mine[uid] == base[uid]:
+            continue  # Removed there, unchanged here
+        merged.append(merge_record(base.get(uid), mine.get(uid), theirs.get(uid), additive))
+    return merged
+
+
+def _selected_uid(trainer):
+    try:
+        return trainer["pokemons"][trainer["selected_pokemon_index"]]["uid"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def merge_trainer(base, mine, theirs):
+    """
+    merge_record for trainers. The merged team can be in a different order than `mine`,
+    so the selection follows the selected Pokémon (whichever side changed it) instead of
+    its slot number.
+    """
+    merged = merge_record(base, mine, theirs)
+    if not isinstance(merged, dict) or not isinstance(merged.get("pokemons"), list):
+        return merged
+    base_uid, mine_uid, theirs_uid = (_selected_uid(trainer) for trainer in (base, mine, theirs))
+    selected = mine_uid if mine_uid != base_uid else theirs_uid if theirs_uid != base_uid else base_uid
+    uids = [poke.get("uid") for poke in merged["pokemons"]]
+    if selected in uids:
+        merged["selected_pokemon_index"] = uids.index(selected)
+    return merged
+
+
+class JsonShardBackend:
+    """Keeps every trainer in its own small JSON file inside a directory."""
+
+    lazy = False  # Small enough to load everything at startup
+    transactional = False  # save_many() can fail halfway, leaving earlier files written
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id: str):
+        return os.path.join(self.directory, f"{user_id}.json")
+
+    def is_empty(self):
+        """True if no trainer has been written yet."""
+        return not any(name.endswith(".json") for name in os.listdir(self.directory))
+
+    def iter_records(self, teamless: bool = False):
+        """
+        Yields (user_id, trainer, balance) for every shard, reading one file at a time.
+        With `teamless`, only trainers without a team (old flat saves, !start without !choose).
+        """
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            with open(os.path.join(self.directory, file_name), "r") as f:
+                try:
+                    record = json.load(f)
+                except json.JSONDecodeError:
+                    print(f"✗ Skipping corrupt trainer file {file_name}")
+                    continue
+            trainer = record.get("trainer")
+            if teamless and (trainer is None or "pokemons" in trainer):
+                continue
+            yield file_name[:-len(".json")], trainer and _decode_trainer(trainer), record.get("balance")
+
+    def load_all(self):
+        """Reads every shard and returns (user_data, user_balance) dicts."""
+        user_data = {}
+        user_balance = {}
+        for user_id, trainer, balance in self.iter_records():
+            if trainer is not None:
+                user_data[user_id] = trainer
+            if balance is not None:
+                user_balance[user_id] = balance
+        return user_data, user_balance
+
+    def save(self, user_id: str, trainer, balance):
+        """Writes a single trainer record (trainer data + balance)."""
+        atomic_write_json(self._path(user_id), {"trainer": trainer, "balance": balance})
+
+    def save_many(self, records):
+        """Writes an iterable of (user_id, trainer, balance) tuples."""
+        for user_id, trainer, balance in records:
+            if trainer is None and balance is None:
+                self.delete(user_id)
+            else:
+                self.save(user_id, trainer, balance)
+
+    def delete(self, user_id: str):
+        if os.path.exists(self._path(user_id)):
+            os.remove(self._path(user_id))
+
+
+class SqliteBackend:
+    """
+    SQLite (WAL) storage: one row per trainer, one row per owned Pokémon and
+    one row per balance, all keyed by user ID. Rows are loaded on first use.
+    """
+
+    lazy = True  # Rows are faulted in per user instead of loading everyone at startup
+    transactional = True  # save_many() commits all of its records or none
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        # Writes happen on the writer thread, reads on the event loop. Each side has its own
+        # connection and lock, so (with WAL) a lazy load never waits for a write transaction.
+        # The timeout lets several bot processes share one database file.
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, timeout=10)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS trainers (
+                user_id TEXT PRIMARY KEY,
+                selected_pokemon_index INTEGER,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pokemons (
+                user_id TEXT NOT NULL,
+                slot INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (user_id, slot)
+            );
+            CREATE TABLE IF NOT EXISTS balances (
+                user_id TEXT PRIMARY KEY,
+                pokecoins INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS journal_marks (
+                journal TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL
+            );
+        """)
+        self.conn.commit()
+        self.read_conn = sqlite3.connect(db_file, check_same_thread=False, timeout=10, isolation_level=None)
+        self.read_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _reading(self):
+        """Holds the read lock inside one read transaction, so a record's rows are read consistently."""
+        with self.read_lock:
+            self.read_conn.execute("BEGIN")
+            try:
+                yield
+            finally:
+                self.read_conn.execute("COMMIT")
+
+    def is_empty(self):
+        """True if no trainer or balance row exists yet."""
+        with self.read_lock:
+            for table in ("trainers", "balances"):
+                if self.read_conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                    return False
+            return True
+
+    def load_trainer(self, user_id: str):
+        """Returns the trainer dict for one user, or None."""
+        with self._reading():
+            return self._load_trainer(user_id)
+
+    def _load_trainer(self, user_id: str, conn=None):
+        conn = conn or self.read_conn
+        row = conn.execute(
+            "SELECT selected_pokemon_index, data FROM trainers WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        trainer = json.loads(row[1])
+        if row[0] is not None:
+            trainer["selected_pokemon_index"] = row[0]
+            trainer["pokemons"] = [
+                Pokemon.from_dict(json.loads(data), slot) for slot, data in conn.execute(
+                    "SELECT slot, data FROM pokemons WHERE user_id = ? ORDER BY slot", (user_id,)
+                )
+            ]
+        return trainer
+
+    def load_balance(self, user_id: str):
+        """Returns the balance dict for one user, or None."""
+        with self._reading():
+            return self._load_balance(user_id)
+
+    def _load_balance(self, user_id: str, conn=None):
+        row = (conn or self.read_conn).execute(
+            "SELECT pokecoins, data FROM balances WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        balance = json.loads(row[1])
+        balance["pokecoins"] = row[0]
+        return balance
+
+    def iter_records(self, teamless: bool = False):
+        """
+        Yields (user_id, trainer, balance) for every user, loading one user at a time.
+        With `teamless`, only trainers without a team (old flat saves, !start without !choose).
+        """
+        query = ("SELECT user_id FROM trainers WHERE selected_pokemon_index IS NULL ORDER BY user_id" if teamless
+                 else "SELECT user_id FROM trainers UNION SELECT user_id FROM balances ORDER BY user_id")
+        with self.read_lock:
+            user_ids = [user_id for (user_id,) in self.read_conn.execute(query)]
+        for user_id in user_ids:
+            # Only hold the lock per user, and never across the yield: the consumer may call back
+            # into this backend
+            with self._reading():
+                record = user_id, self._load_trainer(user_id), self._load_balance(user_id)
+            yield record
+
+    def load_all(self):
+        """Reads every row. Only used for exports; the bot loads rows lazily."""
+        user_data = {}
+        user_balance = {}
+        for user_id, trainer, balance in self.iter_records():
+            if trainer is not None:
+                user_data[user_id] = trainer
+            if balance is not None:
+                user_balance[user_id] = balance
+        return user_data, user_balance
+
+    def _write(self, user_id: str, trainer, balance):
+        if trainer is None:
+            self.conn.execute("DELETE FROM pokemons WHERE user_id = ?", (user_id,))
+            self.conn.execute("DELETE FROM trainers WHERE user_id = ?", (user_id,))
+        else:
+            rest = {k: v for k, v in trainer.items() if k not in ("pokemons", "selected_pokemon_index")}
+            # A trainer who ran !start but not !choose has no team yet (stored as NULL index)
+            selected = trainer.get("selected_pokemon_index") if "pokemons" in trainer else None
+            self.conn.execute(
+                "INSERT OR REPLACE INTO trainers (user_id, selected_pokemon_index, data) VALUES (?, ?, ?)",
+                (user_id, selected, json.dumps(rest, separators=(",", ":"))),
+            )
+            self._write_pokemons(user_id, trainer.get("pokemons", []))
+
+        if balance is None:
+            self.conn.execute("DELETE FROM balances WHERE user_id = ?", (user_id,))
+        else:
+            rest = {k: v for k, v in balance.items() if k != "pokecoins"}
+            self.conn.execute(
+                "INSERT OR REPLACE INTO balances (user_id, pokecoins, data) VALUES (?, ?, ?)",
+                (user_id, balance.get("pokecoins", 0), json.dumps(rest, separators=(",", ":"))),
+            )
+
+    def _write_pokemons(self, user_id: str, pokemons):
+        """Upserts only the slots whose Pokémon changed and deletes slots past the end of the team."""
+        stored = dict(self.conn.execute("SELECT slot, data FROM pokemons WHERE user_id = ?", (user_id,)))
+        rows = [(slot, json.dumps(poke, separators=(",", ":"), ensure_ascii=False, default=encode_record))
+                for slot, poke in enumerate(pokemons)]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO pokemons (user_id, slot, data) VALUES (?, ?, ?)",
+            [(user_id, slot, data) for slot, data in rows if stored.get(slot) != data],
+        )
+        if any(slot >= len(rows) for slot in stored):
+            self.conn.execute("DELETE FROM pokemons WHERE user_id = ? AND slot >= ?", (user_id, len(rows)))
+
+    def save(self, user_id: str, trainer, balance):
+        """Rewrites the rows belonging to a single user."""
+        with self.lock, self.conn:
+            self._write(user_id, trainer, balance)
+
+    def save_many(self, records):
+        """Writes an iterable of (user_id, trainer, balance) tuples in one transaction."""
+        with self.lock, self.conn:
+            for user_id, trainer, balance in records:
+                self._write(user_id, trainer, balance)
+
+    def merge_many(self, records, mark=None):
+        """
+        Writes (user_id, trainer, balance, base_trainer, base_balance) tuples from one of
+        several processes sharing the database: each record is merged (merge_record) with
+        the rows as they are inside the same write transaction, so no process overwrites
+        another's changes. `mark` = (journal name, segment number) is stored in that
+        transaction too, recording that the segment's changes have landed.
+        Returns {user_id: (trainer, balance)} as written (plain JSON values).
+        """
+        merged = {}
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")  # Other processes can't write between our read and write
+            for user_id, trainer, balance, base_trainer, base_balance in records:
+                theirs_trainer = _plain(self._load_trainer(user_id, self.conn))
+                theirs_balance = _plain(self._load_balance(user_id, self.conn))
+                merged[user_id] = (
+                    merge_trainer(_plain(base_trainer), _plain(trainer), theirs_trainer),
+                    merge_record(_plain(base_balance), _plain(balance), theirs_balance, additive=True),
+                )
+                self._write(user_id, *merged[user_id])
+            if mark is not None:
+                self.conn.execute("INSERT OR REPLACE INTO journal_marks (journal, segment) VALUES (?, ?)", mark)
+        return merged
+
+    def journal_mark(self, journal: str):
+        """Number of the newest segment of `journal` whose changes are in the database (0 if none)."""
+        with self._reading():
+            row = self.read_conn.execute("SELECT segment FROM journal_marks WHERE journal = ?", (journal,)).fetchone()
+        return row[0] if row else 0
+
+    def delete(self, user_id: str):
+        self.save(user_id, None, None)
+
+
+class LazyRecordMap(dict):
+    """
+    A dict that loads a user's record from the backend the first time it is looked up,
+    so `user_id in user_data` and `user_data[user_id]` keep working unchanged.
+    Only `[]` access and assignment (commands) count as use for eviction: `in` and
+    get() run on every chat message, and must not keep a record cached (and stale) forever.
+    """
+
+    def __init__(self, loader):
+        super().__init__()
+        self._loader = loader
+        self._absent = set()  # IDs known to have no row, avoids a query per chat message
+        self.last_access = {}  # Key: user_id, Value: time.monotonic() of the last load or [] access
+
+    def _fault_in(self, key):
+        if key in self._absent or dict.__contains__(self, key):
+            return
+        value = self._loader(key)
+        if value is None:
+            self._absent.add(key)
+        else:
+            dict.__setitem__(self, key, value)
+            self.last_access[key] = time.monotonic()
+
+    def __contains__(self, key):
+        self._fault_in(key)
+        return dict.__contains__(self, key)
+
+    def __getitem__(self, key):
+        self._fault_in(key)
+        value = dict.__getitem__(self, key)
+        self.last_access[key] = time.monotonic()
+        return value
+
+    def __setitem__(self, key, value):
+        self._absent.discard(key)
+        dict.__setitem__(self, key, value)
+        self.last_access[key] = time.monotonic()
+
+    def get(self, key, default=None):
+        self._fault_in(key)
+        return dict.get(self, key, default)
+
+    def evict_idle(self, max_idle: float, keep):
+        """
+        Drops cached records not looked up for `max_idle` seconds (except IDs in `keep`)
+        and forgets which IDs were absent, so the next lookup re-reads the shared store.
+        """
+        self._absent.clear()
+        cutoff = time.monotonic() - max_idle
+        for key in [k for k, seen in self.last_access.items() if seen < cutoff and k not in keep]:
+            dict.pop(self, key, None)
+            del self.last_access[key]
+
+
+class BackgroundWriter:
+    """Dedicated thread that serializes and writes trainer records handed to it through a queue."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.queue = queue.Queue()
+        self.last_write_ms = 0.0
+        self.thread = threading.Thread(target=self._run, name="trainer-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, records, on_error=None, on_done=None, before=None, write=None):
+        """
+        Queues records for writing with `write` (default: backend.save_many).
+        `before` runs on the writer thread first (e.g. an fsync).
+        """
+        self.queue.put((records, on_error, on_done, before, write or self.backend.save_many))
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+
+            records, on_error, on_done, before, write = job
+            start = time.perf_counter()
+            try:
+                if before:
+                    before()
+                write(records)
+            except Exception as e:
+                print(f"✗ Error writing trainer data: {e}")
+                if on_error:
+                    on_error(records)
+            else:
+                if on_done:
+                    on_done()
+            self.last_write_ms = (time.perf_counter() - start) * 1000
+            self.queue.task_done()
+
+    def wait(self):
+        """Blocks until everything submitted so far is on disk."""
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+class Journal:
+    """
+    Append-only log of trainer mutations (one JSON line each).
+    Appends only write to a buffer; a background thread flushes and fsyncs the
+    buffer every `fsync_interval` seconds, so a crash loses at most that much.
+    """
+
+    def __init__(self, path: str, fsync_interval: float = 0.2):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+        self.pending = False
+        self.closed = False
+        self.thread = threading.Thread(target=self._sync_loop, name="journal-fsync", daemon=True)
+        self.thread.start()
+
+    def append(self, op: str, user_id: str, fields: dict):
+        line = json.dumps({"op": op, "user": user_id, **fields}, separators=(",", ":"), ensure_ascii=False,
+                          default=encode_record)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.pending = True
+
+    def _sync_loop(self):
+        while not self.closed:
+            time.sleep(self.fsync_interval)
+            with self.lock:
+                if not self.pending or self.file.closed:
+                    continue
+                self.file.flush()
+                self.pending = False
+                fd = self.file.fileno()
+            # fsync outside the lock so appends from the event loop never wait on the disk
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass  # File was rotated underneath us; the writer syncs the segment (sync_segment)
+
+    def rotate(self):
+        """
+        Closes the current log as a numbered segment and starts a new one.
+        Returns the segment path, or None if nothing was logged. Doesn't fsync, so it's
+        cheap on the event loop; call sync_segment() (off the loop) before relying on it.
+        """
+        with self.lock:
+            if self.file.tell() == 0:
+                return None
+            self.file.close()
+            segment = f"{self.path}.{time.time_ns()}"
+            os.replace(self.path, segment)
+            self.file = open(self.path, "a", encoding="utf-8")
+            self.pending = False
+            return segment
+
+    @staticmethod
+    def sync_segment(segment: str):
+        """Forces a rotated segment to disk."""
+        with open(segment, "rb") as f:
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def segment_number(segment: str):
+        return int(segment.rsplit(".", 1)[1])
+
+    def segments(self):
+        """Rotated segments that are not yet covered by a snapshot, oldest first."""
+        return sorted(glob.glob(f"{self.path}.*"), key=self.segment_number)
+
+    def discard_through(self, segment: str):
+        """Deletes `segment` and every older one once a snapshot includes them."""
+        cutoff = self.segment_number(segment)
+        for path in self.segments():
+            if self.segment_number(path) <= cutoff:
+                os.remove(path)
+
+    def read_all(self, after: int = 0):
+        """
+        Yields every logged record, oldest first, skipping segments numbered `after` or
+        lower (already in the database). A torn final line is ignored.
+        """
+        with self.lock:
+            self.file.flush()
+        segments = [path for path in self.segments() if self.segment_number(path) > after]
+        for path in segments + [self.path]:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"✗ Ignoring torn journal entry in {path}")
+
+    def close(self):
+        self.closed = True
+        self.thread.join()
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+
+def apply_journal_record(record: dict, user_data: dict, user_balance: dict):
+    """
+    Re-applies one journal record. Records carry absolute values (not deltas),
+    so replaying a record the snapshot already contains is harmless.
+    """
+    op = record["op"]
+    user_id = record["user"]
+
+    if op == "base":
+        pass  # Where a shared store's changes started from; read by TrainerStore._replay_shared
+    elif op == "trainer":
+        user_data[user_id] = _decode_trainer(record["trainer"])
+    elif op == "balance":
+        user_balance[user_id] = record["balance"]
+    elif op == "spend":
+        user_balance[user_id]["pokeballs"][record["item"]] = record["count"]
+    elif op == "select":
+        user_data[user_id]["selected_pokemon_index"] = record["index"]
+    elif op == "catch":
+        pokemons = user_data[user_id].setdefault("pokemons", [])
+        pokemon = Pokemon.from_dict(record["pokemon"])
+        uids = [poke.uid for poke in pokemons]
+        if pokemon.uid in uids:
+            pokemons[uids.index(pokemon.uid)] = pokemon
+        elif "uid" not in record["pokemon"] and record["slot"] < len(pokemons):
+            pokemons[record["slot"]] = pokemon  # Journaled before Pokémon had IDs
+        else:
+            pokemons.append(pokemon)
+    elif op in ("xp", "level_up", "evolve", "learn"):
+        user_data[user_id]["pokemons"][record["slot"]].update(record["fields"])
+    else:
+        raise ValueError(f"Unknown journal op '{op}'")
+
+
+class TrainerStore:
+    """
+    Remembers which trainers changed since the last flush and writes only those.
+    A flush with nothing dirty does no I/O at all. With a background writer the
+    event loop only copies the dirty records; serialization and disk writes
+    happen on the writer thread.
+
+    With `shared=True` (several processes on one SqliteBackend) records aren't written
+    whole: the store remembers each cached record's base (the version last read or
+    written) and the backend merges the changes made since then into the current rows
+    (merge_many). What the merge wrote goes back into the cache and becomes the new
+    base, so other processes' changes show up. The journal logs the base too, so a
+    replay after a crash is merged the same way instead of overwriting other processes' writes.
+    """
+
+    def __init__(self, backend, background: bool = True, journal: Journal = None, shared: bool = False):
+        self.backend = backend
+        self.shared = shared
+        self.bases = {}  # Shared mode. Key: user_id, Value: [trainer, balance] as last read or written
+        self.journaled = set()  # Shared mode: IDs whose base is in the current journal segment
+        self.merged = []  # Shared mode: {user_id: (trainer, balance)} from finished merge_many() calls
+        self.dirty = set()
+        self.writer = BackgroundWriter(backend) if background else None
+        self.journal = journal
+        self.maps = ()  # The lazy maps handed out by open(), for evict_idle()
+        self.writing = set()  # IDs handed to the writer thread but not yet on disk
+        self.listeners = []  # Called as listener(op, user_id, fields) after every recorded change
+
+        # How long each flush held the event loop, in milliseconds
+        self.saves = 0
+        self.last_block_ms = 0.0
+        self.max_block_ms = 0.0
+        self.total_block_ms = 0.0
+
+    def open(self):
+        """Returns the (user_data, user_balance) mappings the bot works on."""
+        if self.backend.lazy:
+            load_trainer, load_balance = self.backend.load_trainer, self.backend.load_balance
+            if self.shared:
+                load_trainer, load_balance = self._remembering(0, load_trainer), self._remembering(1, load_balance)
+            self.maps = (LazyRecordMap(load_trainer), LazyRecordMap(load_balance))
+            return self.maps
+        return self.backend.load_all()
+
+    def _remembering(self, kind: int, load):
+        """Wraps a loader so every record read from the backend becomes that record's base."""
+        def loader(user_id):
+            value = load(user_id)
+            base = list(self.bases.get(user_id, (None, None)))
+            base[kind] = copy.deepcopy(value)
+            self.bases[user_id] = base
+            return value
+        return loader
+
+    def evict_idle(self, max_idle: float):
+        """
+        When several processes share the backend, drops idle cached trainers so other
+        processes' changes are picked up. Unsaved or still-writing records are kept.
+        """
+        keep = self.dirty | self.writing
+        for lazy_map in self.maps:
+            lazy_map.evict_idle(max_idle, keep)
+        self.bases = {user_id: base for user_id, base in self.bases.items()
+                      if user_id in keep or any(dict.__contains__(lazy_map, user_id) for lazy_map in self.maps)}
+
+    def mark_dirty(self, user_id):
+        """Call after mutating user_data[user_id] or user_balance[user_id]."""
+        self.dirty.add(str(user_id))
+
+    def record(self, op: str, user_id, **fields):
+        """
+        Journals a mutation so it survives a crash before the next flush,
+        then marks the trainer dirty. See apply_journal_record for the ops.
+        """
+        user_id = str(user_id)
+        if self.journal is not None:
+            if self.shared and user_id not in self.journaled:
+                base_trainer, base_balance = self.bases.get(user_id, (None, None))
+                self.journal.append("base", user_id, {"trainer": base_trainer, "balance": base_balance})
+                self.journaled.add(user_id)
+            self.journal.append(op, user_id, fields)
+        self.dirty.add(user_id)
+        for listener in self.listeners:
+            listener(op, user_id, fields)
+
+    def replay_journal(self, user_data: dict, user_balance: dict):
+        """Applies journaled mutations on top of the loaded snapshot. Returns the count."""
+        if self.journal is None:
+            return 0
+        if self.shared:
+            return self._replay_shared()
+
+        replayed = 0
+        for record in self.journal.read_all():
+            if record["op"] == "base":
+                continue
+            try:
+                apply_journal_record(record, user_data, user_balance)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                print(f"✗ Skipping journal record {record}: {e}")
+                continue
+            self.dirty.add(record["user"])
+            replayed += 1
+        return replayed
+
+    def _replay_shared(self):
+        """
+        Shared-mode replay: rebuilds each trainer's unsaved version from its journaled base
+        plus the ops after it, and merges that into the rows as they are now, skipping
+        segments a flush already landed. Writes directly; the caches fault in the result.
+        """
+        segment = self.journal.rotate()
+        landed = self.backend.journal_mark(self.journal.name)
+        bases = {}  # Key: user_id, Value: [trainer, balance] the journaled changes started from
+        mine = ({}, {})  # user_data / user_balance with the journaled changes applied
+        replayed = 0
+        for record in self.journal.read_all(after=landed):
+            user_id = record["user"]
+            if user_id not in bases:
+                if record["op"] == "base":
+                    trainer = record["trainer"]
+                    base = [trainer and _decode_trainer(trainer), record["balance"]]
+                else:  # No base logged: rebase on the rows as they are now
+                    base = [self.backend.load_trainer(user_id), self.backend.load_balance(user_id)]
+                bases[user_id] = base
+                for records, value in zip(mine, base):
+                    if value is not None:
+                        records[user_id] = copy.deepcopy(value)
+            if record["op"] == "base":
+                continue
+            try:
+                apply_journal_record(record, *mine)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                print(f"✗ Skipping journal record {record}: {e}")
+                continue
+            replayed += 1
+
+        if bases:
+            mark = (self.journal.name, Journal.segment_number(segment)) if segment else None
+            self.backend.merge_many(
+                [(user_id, mine[0].get(user_id), mine[1].get(user_id), *base) for user_id, base in bases.items()],
+                mark,
+            )
+        if segment:
+            self.journal.discard_through(segment)
+        return replayed
+
+    def _refresh_merged(self, user_data: dict, user_balance: dict):
+        """
+        Shared mode: puts the records merge_many() wrote back into the cache and makes them
+        the new bases. Trainers changed since keep their version (and the written snapshot
+        as base); trainers no longer cached are read again on their next lookup.
+        """
+        while self.merged:
+            for user_id, (trainer, balance) in self.merged.pop(0).items():
+                if user_id in self.dirty or user_id in self.writing:
+                    continue
+                if not any(dict.__contains__(records, user_id) for records in (user_data, user_balance)):
+                    continue
+                trainer = trainer and _decode_trainer(trainer)
+                for records, value in zip((user_data, user_balance), (trainer, balance)):
+                    if value is None:
+                        dict.pop(records, user_id, None)
+                    else:
+                        dict.__setitem__(records, user_id, value)  # Not a lookup: leaves last_access alone
+                self.bases[user_id] = [copy.deepcopy(trainer), copy.deepcopy(balance)]
+                for listener in self.listeners:
+                    listener("trainer", user_id, {"trainer": trainer})
+
+    def flush(self, user_data: dict, user_balance: dict):
+        """Persists every dirty trainer. Returns how many records were written."""
+        if self.merged:
+            self._refresh_merged(user_data, user_balance)
+        if not self.dirty:
+            return 0
+
+        start = time.perf_counter()
+        dirty, self.dirty = self.dirty, set()
+
+        # Compaction: everything journaled so far is part of this snapshot, so the
+        # rotated segment can be deleted once the snapshot is safely written
+        segment = self.journal.rotate() if self.journal is not None else None
+        sync_segment = (lambda: Journal.sync_segment(segment)) if segment else None
+        self.journaled = set()
+        self.writing |= dirty
+        merged = {}  # Shared mode: filled in by merge_many() on the writer thread
+
+        def on_done():
+            if merged:
+                self.merged.append(merged)
+            self.writing -= dirty
+            if segment:
+                self.journal.discard_through(segment)
+
+        write = self.backend.save_many
+        if self.shared:
+            # Each record goes out with its base; what's written becomes the next base
+            records = []
+            for user_id in dirty:
+                snapshot = [copy.deepcopy(user_data.get(user_id)), copy.deepcopy(user_balance.get(user_id))]
+                records.append((user_id, *snapshot, *self.bases.get(user_id, (None, None))))
+                self.bases[user_id] = snapshot
+            mark = (self.journal.name, Journal.segment_number(segment)) if segment else None
+            write = lambda records: merged.update(self.backend.merge_many(records, mark))
+        elif self.writer is None:
+            records = [(user_id, user_data.get(user_id), user_balance.get(user_id)) for user_id in dirty]
+        else:
+            # Snapshot only the dirty records so commands can keep mutating the live dicts
+            records = [
+                (user_id, copy.deepcopy(user_data.get(user_id)), copy.deepcopy(user_balance.get(user_id)))
+                for user_id in dirty
+            ]
+
+        if self.writer is None:
+            if sync_segment:
+                sync_segment()
+            write(records)
+            on_done()
+        else:
+            self.writer.submit(records, self._requeue, on_done, before=sync_segment, write=write)
+
+        blocked_ms = (time.perf_counter() - start) * 1000
+        self.saves += 1
+        self.last_block_ms = blocked_ms
+        self.max_block_ms = max(self.max_block_ms, blocked_ms)
+        self.total_block_ms += blocked_ms
+        return len(dirty)
+
+    def _requeue(self, records):
+        """Marks records dirty again after a failed write so the next flush retries them."""
+        for user_id, trainer, balance, *base in records:
+            self.dirty.add(user_id)
+            self.writing.discard(user_id)
+            # Shared mode: the database still has the old version, so the old base stands
+            current = self.bases.get(user_id)
+            if base and current and current[0] is trainer and current[1] is balance:
+                self.bases[user_id] = base
+
+    def close(self):
+        """Waits for pending writes and stops the writer and journal threads."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def import_legacy_files(self, user_data_file: str, user_balance_file: str = None):
+        """
+        One-time import of the old single-file user_data.json / user_balance.json, or of
+        a .jsonl export. Trainers are streamed in one at a time. Returns the number imported.
+        All or nothing: a malformed file leaves the backend empty and the error propagates,
+        so the import is retried on the next start.
+        """
+        imported = []
+
+        def tracked(records):
+            for record in records:
+                imported.append(record[0])
+                yield record
+
+        try:
+            self.backend.save_many(tracked(iter_trainer_records(user_data_file, user_balance_file)))
+        except Exception:
+            if not self.backend.transactional:
+                for user_id in imported:
+                    self.backend.delete(user_id)
+            raise
+        return len(imported)
+
+    def export_records(self, path: str):
+        """Streams every saved trainer to a JSON Lines file. Returns the number written."""
+        return write_trainer_records(path, self.backend.iter_records())
+
+
+class SharedInbox:
+    """
+    Cross-process mailbox in the shared SQLite file. Discord delivers every DM to
+    shard 0, so the worker owning shard 0 drops battle moves here and the worker
+    running that battle picks them up.
+    """
+
+    def __init__(self, db_file: str, max_age: float = 60):
+        self.max_age = max_age
+        # Used from worker threads (asyncio.to_thread), so one connection guarded by a lock
+        self.conn = sqlite3.connect(db_file, timeout=10, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS dm_inbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS dm_inbox_user ON dm_inbox (user_id);
+        """)
+        self.conn.commit()
+
+    def put(self, user_id: str, content: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO dm_inbox (user_id, content, created) VALUES (?, ?, ?)",
+                (user_id, content, time.time()),
+            )
+
+    def take(self, user_ids):
+        """Removes and returns [(user_id, content), ...] for the given users, oldest first."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+
+        placeholders = ",".join("?" * len(user_ids))
+        with self.lock, self.conn:
+            # Messages nobody claimed in time belong to battles that are already over
+            self.conn.execute("DELETE FROM dm_inbox WHERE created < ?", (time.time() - self.max_age,))
+            rows = self.conn.execute(
+                f"SELECT id, user_id, content FROM dm_inbox WHERE user_id IN ({placeholders}) ORDER BY id",
+                user_ids,
+            ).fetchall()
+            if rows:
+                self.conn.executemany("DELETE FROM dm_inbox WHERE id = ?", [(row[0],) for row in rows])
+        return [(user_id, content) for _, user_id, content in rows]
+
+
+# --- Streaming JSON ---
+# Exports are JSON Lines, one compact {"user", "trainer", "balance"} object per line,
+# so neither writing nor reading one ever holds more than a single trainer.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkedJsonReader:
+    """Hands out the JSON values in a file one at a time, reading it in chunks."""
+
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self, size: int):
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what's been parsed already; only the current value stays buffered
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character ("" at the end of the file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more(self.chunk_size):
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        if self.peek() not in '{["':
+            self._buffer_token()
+        while True:
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # The value runs past the buffer: read at least as much again and retry
+            self._read_more(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def _buffer_token(self):
+        """
+        Reads until a bare number/true/false/null is followed by a delimiter. raw_decode
+        would otherwise stop at the chunk boundary and return a prefix ("1.5" as 1).
+        """
+        scanned = self.pos
+        while True:
+            while scanned < len(self.buffer) and self.buffer[scanned] not in ",:]} \t\r\n":
+                scanned += 1
+            if scanned < len(self.buffer):
+                return
+            scanned -= self.pos  # _read_more() moves the current value to the start of the buffer
+            if not self._read_more(self.chunk_size):
+                return
+
+
+def iter_json_object(path: str, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yields the (key, value) members of a file holding one big JSON object, one at a time."""
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _ChunkedJsonReader(f, chunk_size)
+        if reader.peek() == "":
+            return  # Empty file
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            yield key, reader.value()
+            if reader.peek() != ",":
+                reader.expect("}")
+                return
+            reader.expect(",")
+
+
+def iter_trainer_records(user_data_file: str, user_balance_file: str = None):
+    """
+    Yields (user_id, trainer, balance) from a .jsonl export, or from the legacy
+    user_data.json + user_balance.json pair. Legacy balances are small and read up
+    front to pair them with trainers; trainers are streamed. A malformed record
+    raises (json.JSONDecodeError or KeyError) so the caller can undo the import.
+    """
+    if user_data_file.endswith(".jsonl"):
+        with open(user_data_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["user"], record.get("trainer"), record.get("balance")
+        return
+
+    balances = {}
+    if user_balance_file and os.path.exists(user_balance_file):
+        balances = dict(iter_json_object(user_balance_file))
+    if os.path.exists(user_data_file):
+        for user_id, trainer in iter_json_object(user_data_file):
+            yield user_id, trainer, balances.pop(user_id, None)
+    for user_id, balance in balances.items():
+        yield user_id, None, balance  # Has coins but never ran !start
+
+
+def write_trainer_records(path: str, records):
+    """Streams (user_id, trainer, balance) records to a JSON Lines file, atomically. Returns the count."""
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for user_id, trainer, balance in records:
+            f.write(json.dumps({"user": user_id, "trainer": trainer, "balance": balance},
+                               separators=(",", ":"), ensure_ascii=False, default=encode_record))
+            f.write("\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the legacy JSON save files (or a .jsonl export) into SQLite.")
+    parser.add_argument("--db", default="trainers.db")
+    parser.add_argument("--user-data", default="user_data.json", help="Legacy user_data.json or a .jsonl export")
+    parser.add_argument("--user-balance", default="user_balance.json")
+    parser.add_argument("--export", metavar="FILE", help="Instead of importing, stream every trainer to a .jsonl file")
+    args = parser.parse_args()
+
+    store = TrainerStore(SqliteBackend(args.db), background=False)
+    if args.export:
+        count = store.export_records(args.export)
+        print(f"✅ Exported {count} trainers from {args.db} to {args.export}")
+    else:
+        count = store.import_legacy_files(args.user_data, args.user_balance)
+        print(f"✅ Imported {count} trainers into {args.db}")
@@ -0,0 +1,118 @@
+import bisect
+import time
+
+MAX_ORDERS = 8  # Sorted/filtered orders kept per trainer; the oldest is dropped past this
+
+TEAM_SORTS = {
+    "slot": lambda row: row.slot,                    # Catch order (the numbers !select uses)
+    "level": lambda row: (-row.level, row.slot),
+    "iv": lambda row: (-row.iv_percent, row.slot),
+    "name": lambda row: (row.name, row.slot),
+}
+
+
+class TeamRow:
+    """What !team shows for one owned Pokémon, computed when it changes instead of per view."""
+
+    __slots__ = ("slot", "name", "gender", "level", "iv_percent", "types")
+
+    def __init__(self, slot: int, pokemon, types):
+        self.slot = slot
+        self.name = pokemon["name"]
+        self.gender = pokemon["gender"]
+        self.level = pokemon["level"]
+        self.iv_percent = sum(pokemon["ivs"].values()) / (31 * 6) * 100
+        self.types = types
+
+
+class TeamSummary:
+    """One trainer's rows plus every sorted/filtered order someone has asked for."""
+
+    __slots__ = ("pokemons", "rows", "orders", "last_access")
+
+    def __init__(self, pokemons, rows):
+        self.pokemons = pokemons  # The list the rows were built from; a new list means a reload
+        self.rows = rows
+        self.orders = {}  # Key: (sort, species or None), Value: slots in display order, oldest first
+        self.last_access = time.monotonic()
+
+
+class TeamIndex:
+    """
+    Per-trainer summary index for !team. Rows are built the first time a trainer's
+    collection is listed and then kept current from the same mutation ops the journal
+    sees (catch, level_up, evolve, trainer), one row at a time. Each sort/filter order
+    is built once and patched in place on later changes, so a page costs
+    O(page size) no matter how big the collection is.
+    """
+
+    def __init__(self, species_types):
+        self.species_types = species_types  # Callable: species name -> tuple of type names
+        self.summaries = {}  # Key: user_id, Value: TeamSummary
+
+    def _row(self, slot: int, pokemon):
+        return TeamRow(slot, pokemon, self.species_types(pokemon["name"]))
+
+    def summary(self, user_id: str, pokemons):
+        """The trainer's summary, (re)built if it's missing or was built from other data."""
+        summary = self.summaries.get(user_id)
+        if summary is None or summary.pokemons is not pokemons or len(summary.rows) != len(pokemons):
+            rows = [self._row(slot, pokemon) for slot, pokemon in enumerate(pokemons)]
+            summary = self.summaries[user_id] = TeamSummary(pokemons, rows)
+        summary.last_access = time.monotonic()
+        return summary
+
+    def page(self, user_id: str, pokemons, page: int, per_page: int, sort: str = "slot", species: str = None):
+        """Returns (rows on the page, number of matching Pokémon)."""
+        summary = self.summary(user_id, pokemons)
+        order = summary.orders.get((sort, species))
+        if order is None:
+            if len(summary.orders) >= MAX_ORDERS:
+                del summary.orders[next(iter(summary.orders))]
+            rows = summary.rows if species is None else [row for row in summary.rows if row.name == species]
+            order = summary.orders[(sort, species)] = [row.slot for row in sorted(rows, key=TEAM_SORTS[sort])]
+
+        start = (page - 1) * per_page
+        return [summary.rows[slot] for slot in order[start:start + per_page]], len(order)
+
+    # --- Incremental updates ---
+    def apply(self, op: str, user_id: str, fields: dict):
+        """TrainerStore listener: patches the trainer's summary after a journaled change."""
+        summary = self.summaries.get(user_id)
+        if summary is None:
+            return
+        if op == "trainer":
+            del self.summaries[user_id]  # Whole trainer replaced; rebuilt on the next view
+        elif op in ("catch", "level_up", "evolve"):
+            slot = fields["slot"]
+            if slot < len(summary.pokemons):
+                self._update(summary, slot)
+
+    def _update(self, summary: TeamSummary, slot: int):
+        old = summary.rows[slot] if slot < len(summary.rows) else None
+        if old is None and slot != len(summary.rows):
+            summary.pokemons = None  # Out-of-order catch: rebuild on the next view
+            return
+        row = self._row(slot, summary.pokemons[slot])
+
+        # Every sort key ends in the slot, so each row has exactly one place in an order
+        for (sort, species), order in summary.orders.items():
+            if old is not None and species in (None, old.name):
+                key = TEAM_SORTS[sort]
+                del order[bisect.bisect_left(order, key(old), key=lambda s: key(summary.rows[s]))]
+
+        if old is None:
+            summary.rows.append(row)
+        else:
+            summary.rows[slot] = row
+
+        for (sort, species), order in summary.orders.items():
+            if species in (None, row.name):
+                key = TEAM_SORTS[sort]
+                bisect.insort(order, slot, key=lambda s: key(summary.rows[s]))
+
+    def evict_idle(self, max_idle: float):
+        """Drops summaries nobody has listed for `max_idle` seconds."""
+        cutoff = time.monotonic() - max_idle
+        for user_id in [u for u, summary in self.summaries.items() if summary.last_access < cutoff]:
+            del self.summaries[user_id]
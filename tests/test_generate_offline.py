@@ -0,0 +1,38 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetch import Fetcher
+from generate_pokedex import generate_kanto_pokedex
+
+# Cached PokéAPI responses for Bulbasaur only, in the Fetcher's cache layout
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "api_cache")
+
+
+def test_generate_pokedex_offline(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)  # generate_kanto_pokedex writes to the current directory
+
+    generate_kanto_pokedex(Fetcher(cache_dir=FIXTURES, offline=True))
+
+    with open(tmp_path / "pokedex_data.json", encoding="utf-8") as f:
+        pokedex = json.load(f)
+    assert list(pokedex) == ["bulbasaur"]
+    entry = pokedex["bulbasaur"]
+    assert entry["number"] == 1
+    assert entry["types"] == ["Grass", "Poison"]
+    assert entry["base_stats"] == {"hp": 45, "attack": 49, "defense": 49, "sp_atk": 65, "sp_def": 65, "speed": 45}
+    assert entry["abilities"] == ["Overgrow", "Chlorophyll"]
+    assert entry["height"] == "0.7 m"
+    assert entry["weight"] == "6.9 kg"
+    assert entry["category"] == "Seed Pokémon"
+    assert entry["description"].startswith("A strange seed was planted")
+    assert entry["gender_ratio"] == "♂ 87.5% / ♀ 12.5%"
+    assert entry["evolution"] == "Bulbasaur → Ivysaur → Venusaur"
+
+    # Everything not in the fixtures is reported and skipped, never fetched
+    output = capsys.readouterr().out
+    assert "✓ #001 Bulbasaur" in output
+    assert "✗ Error fetching #151" in output
+    assert "not in the offline cache" in output
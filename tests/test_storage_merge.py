@@ -0,0 +1,147 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pokemon import Pokemon
+from storage import Journal, SqliteBackend, TrainerStore, merge_record, merge_trainer
+
+USER = "1001"
+
+
+def poke(uid, name="pidgey", level=5, xp=0):
+    return {"uid": uid, "name": name, "level": level, "xp": xp}
+
+
+def team(*pokemons, selected=0):
+    return {"pokemons": list(pokemons), "selected_pokemon_index": selected, "items": {}}
+
+
+def test_merge_record_takes_each_sides_changes():
+    base = {"a": 1, "b": 1, "c": 1}
+    assert merge_record(base, {"a": 2, "b": 1, "c": 1}, {"a": 1, "b": 3, "c": 1}) == {"a": 2, "b": 3, "c": 1}
+    # Both changed: mine wins, unless the values are counters
+    assert merge_record(base, {**base, "c": 5}, {**base, "c": 7}) == {**base, "c": 5}
+    assert merge_record({"coins": 100}, {"coins": 90}, {"coins": 150}, additive=True) == {"coins": 140}
+
+
+def test_merge_record_matches_pokemon_by_uid():
+    base = [poke("a"), poke("b")]
+    mine = [poke("a"), poke("b", level=6), poke("mine")]
+    theirs = [poke("a", xp=40), poke("b"), poke("theirs")]
+    assert merge_record(base, mine, theirs) == [
+        poke("a", xp=40), poke("b", level=6), poke("theirs"), poke("mine"),
+    ]
+
+
+def test_merge_trainer_selection_follows_the_pokemon():
+    base = team(poke("a"))
+    mine = team(poke("a"), poke("mewtwo", "mewtwo"), selected=1)
+    theirs = team(poke("a"), poke("pidgey"))
+    merged = merge_trainer(base, mine, theirs)
+    assert [p["uid"] for p in merged["pokemons"]] == ["a", "pidgey", "mewtwo"]
+    assert merged["selected_pokemon_index"] == 2
+
+
+def seed(db_file, count=5):
+    backend = SqliteBackend(db_file)
+    backend.save(USER, {"pokemons": [Pokemon("rattata", 5) for _ in range(count)],
+                        "selected_pokemon_index": 0, "items": {}}, {"pokecoins": 100})
+    return backend
+
+
+def worker(db_file, **kwargs):
+    store = TrainerStore(SqliteBackend(db_file), background=False, shared=True, **kwargs)
+    user_data, user_balance = store.open()
+    return store, user_data, user_balance
+
+
+def catch(store, user_data, name):
+    pokemons = user_data[USER]["pokemons"]
+    pokemons.append(Pokemon(name, 5))
+    store.record("catch", USER, slot=len(pokemons) - 1, pokemon=pokemons[-1])
+
+
+def test_two_workers_merge_catches_and_level_ups(tmp_path):
+    db_file = str(tmp_path / "trainers.db")
+    seed(db_file)
+    a, a_data, a_balance = worker(db_file)
+    b, b_data, b_balance = worker(db_file)
+
+    catch(a, a_data, "pidgey")
+    catch(b, b_data, "mewtwo")
+    a.flush(a_data, a_balance)
+    b.flush(b_data, b_balance)
+
+    # B's slot 5 is still its Mewtwo; the level-up must not land on A's Pidgey
+    b_data[USER]["pokemons"][5]["level"] = 6
+    b.record("level_up", USER, slot=5, fields={"level": 6})
+    b.flush(b_data, b_balance)
+
+    stored = SqliteBackend(db_file).load_trainer(USER)
+    names = [(p["name"], p["level"]) for p in stored["pokemons"][5:]]
+    assert names == [("pidgey", 5), ("mewtwo", 6)]
+
+    # What B's merge wrote comes back into its cache on its next flush
+    b.flush(b_data, b_balance)
+    assert [(p["name"], p["level"]) for p in b_data[USER]["pokemons"][5:]] == [("pidgey", 5), ("mewtwo", 6)]
+    assert b.bases[USER][0]["pokemons"][5]["name"] == "pidgey"
+
+    # A wrote before B, so it only sees B's catch once its idle cache is evicted and re-read
+    a.flush(a_data, a_balance)
+    assert [p["name"] for p in a_data[USER]["pokemons"][5:]] == ["pidgey"]
+    a.evict_idle(0)
+    assert [p["name"] for p in a_data[USER]["pokemons"][5:]] == ["pidgey", "mewtwo"]
+
+
+def test_merge_many_balances_are_additive(tmp_path):
+    db_file = str(tmp_path / "trainers.db")
+    seed(db_file)
+    a, a_data, a_balance = worker(db_file)
+    b, b_data, b_balance = worker(db_file)
+
+    a_balance[USER]["pokecoins"] -= 30
+    a.mark_dirty(USER)
+    b_balance[USER]["pokecoins"] += 50
+    b.mark_dirty(USER)
+    a.flush(a_data, a_balance)
+    b.flush(b_data, b_balance)
+
+    assert SqliteBackend(db_file).load_balance(USER)["pokecoins"] == 120
+
+
+def test_replay_shared_merges_journal_into_other_workers_writes(tmp_path):
+    db_file = str(tmp_path / "trainers.db")
+    seed(db_file)
+    journal_file = str(tmp_path / "trainers-w0.journal")
+
+    # Worker A catches a Pidgey and crashes before flushing
+    a, a_data, _ = worker(db_file, journal=Journal(journal_file))
+    catch(a, a_data, "pidgey")
+    a.close()
+
+    # Meanwhile worker B's Mewtwo is written
+    b, b_data, b_balance = worker(db_file)
+    catch(b, b_data, "mewtwo")
+    b.flush(b_data, b_balance)
+
+    restarted = TrainerStore(SqliteBackend(db_file), background=False, shared=True, journal=Journal(journal_file))
+    assert restarted.replay_journal(*restarted.open()) == 1
+    stored = SqliteBackend(db_file).load_trainer(USER)
+    assert sorted(p["name"] for p in stored["pokemons"][5:]) == ["mewtwo", "pidgey"]
+
+    # The landed segment is discarded, so a second restart replays nothing
+    restarted.close()
+    again = TrainerStore(SqliteBackend(db_file), background=False, shared=True, journal=Journal(journal_file))
+    assert again.replay_journal(*again.open()) == 0
+    again.close()
+
+
+def test_rows_saved_before_uids_get_the_same_uid_everywhere(tmp_path):
+    backend = SqliteBackend(str(tmp_path / "trainers.db"))
+    with backend.conn:
+        backend.conn.execute("INSERT INTO trainers VALUES (?, 0, '{}')", (USER,))
+        backend.conn.execute("INSERT INTO pokemons VALUES (?, 0, ?)", (USER, '{"name": "rattata", "level": 5}'))
+    first = backend.load_trainer(USER)["pokemons"][0]
+    again = SqliteBackend(backend.db_file).load_trainer(USER)["pokemons"][0]
+    assert first["uid"] == again["uid"]